@@ -14,3 +14,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
 application = get_asgi_application()
+
+# Serve collected static files before Django's URL resolver.
+from mysite.static import StaticFilesASGI  # noqa: E402
+
+application = StaticFilesASGI(application)
+
+# Initialise routes, templates, auth and databases before the first request
+# if settings.WARM_UP is on; /ready/ answers 503 until that is done.
+from mysite.warmup import start_warm_up  # noqa: E402
+
+start_warm_up()
@@ -0,0 +1,122 @@
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Name of the cookie that keeps a client on the primary after a write.
+PIN_COOKIE = 'db_pin'
+
+# Alias of the database holding the votes of archived polls.
+ARCHIVE_ALIAS = 'archive'
+
+# Models kept in the archive database, as (app label, model name).
+ARCHIVE_MODELS = {('polls', 'archivedvote')}
+
+# Alias every read of the current request goes to, chosen once per request
+# by PrimaryPinningMiddleware, so the pages of a request do not mix
+# replicas that lag behind by different amounts.
+_read_alias = contextvars.ContextVar('db_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+
+
+def is_archived(model):
+    return (model._meta.app_label, model._meta.model_name) in ARCHIVE_MODELS
+
+
+def pin_to_primary():
+    """
+    Send the reads of the rest of the current request to the primary.
+    """
+    _read_alias.set('default')
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the 'default' database and reads to one of the
+    settings.DATABASE_REPLICA_ALIASES. Within a request, all reads go to
+    the alias PrimaryPinningMiddleware picked for it; outside requests
+    (commands, background tasks) each read picks a replica.
+
+    The ARCHIVE_MODELS are read from and written to the 'archive' database
+    only, which has no replicas.
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_archived(model):
+            return ARCHIVE_ALIAS
+        alias = _read_alias.get()
+        if alias is not None:
+            return alias
+        replicas = replica_aliases()
+        if not replicas:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if is_archived(model):
+            return ARCHIVE_ALIAS
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data, and archived rows only refer to
+        # the primary by id.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive their schema by replication from the primary.
+        if (app_label, model_name) in ARCHIVE_MODELS:
+            return db == ARCHIVE_ALIAS
+        return db == 'default'
+
+
+class PrimaryPinningMiddleware:
+    """
+    Pin requests that write, and the requests of the same client for
+    settings.DATABASE_REPLICA_PIN_SECONDS after them, to the primary, so a
+    user always reads their own writes (e.g. the results page shown after
+    voting) even while the replicas lag behind. Other requests read from
+    one replica, picked at random per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.pin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.remember(request, response)
+
+    async def __acall__(self, request):
+        token = self.pin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        return self.remember(request, response)
+
+    def pin(self, request):
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        replicas = replica_aliases()
+        if writes or PIN_COOKIE in request.COOKIES or not replicas:
+            return _read_alias.set('default')
+        return _read_alias.set(random.choice(replicas))
+
+    def remember(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1', httponly=True, samesite='Lax',
+                max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+        return response
@@ -0,0 +1,236 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestMetricsMiddleware measures, for every request, the number of SQL
+queries, the time spent in the database, the time spent rendering
+templates and the total time. It reports them to the client in a
+Server-Timing header and aggregates them per URL name into histograms,
+which the mysite.views.metrics endpoint exposes in the Prometheus text
+format.
+"""
+import contextvars
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+# Upper bounds of the histogram buckets.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Counters of the request being handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries of the current request
+    and the time they take.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Count the queries of every new database connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_connections():
+    """
+    Count the queries of the connections of this thread, including those
+    opened before this module was imported.
+    """
+    for connection in connections.all():
+        instrument_connection(None, connection)
+
+
+class TimedTemplate:
+    """
+    Wrapper of a template of the Django backend that measures rendering.
+    """
+
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self._template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend with rendering time measured per request.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket bounds.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    Histograms of request metrics per URL name, shared by all threads of
+    the process.
+    """
+
+    series = (
+        ('polls_request_duration_seconds', "Total request time.",
+         SECONDS_BUCKETS),
+        ('polls_request_db_queries', "SQL queries per request.",
+         QUERY_BUCKETS),
+        ('polls_request_db_seconds', "Time spent in SQL queries.",
+         SECONDS_BUCKETS),
+        ('polls_request_template_seconds', "Time spent rendering templates.",
+         SECONDS_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, view, total, metrics):
+        values = (total, metrics.queries, metrics.db_time,
+                  metrics.template_time)
+        with self._lock:
+            for (name, _, bounds), value in zip(self.series, values):
+                histogram = self._histograms.get((name, view))
+                if histogram is None:
+                    histogram = self._histograms[(name, view)] = (
+                        Histogram(bounds))
+                histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Return all histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, description, _ in self.series:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (series, view), histogram in sorted(
+                        self._histograms.items()):
+                    if series != name:
+                        continue
+                    label = f'view="{view}"'
+                    for bound, count in zip(histogram.bounds,
+                                            histogram.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} '
+                                     f'{count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} '
+                                 f'{histogram.count}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure each request and report it in a Server-Timing header and in the
+    per-view histograms of `registry`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        instrument_connections()
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, total, metrics)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.2f};'
+            f'desc="{metrics.queries} queries"',
+            f'tpl;dur={metrics.template_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
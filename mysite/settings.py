@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.RequestMetricsMiddleware',
+    'mysite.db_routers.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +57,8 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with the rendering time of requests measured.
+        'BACKEND': 'mysite.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -72,6 +75,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Serve the detail, results and vote pages with native async views; only
+# useful when running under an ASGI server.
+POLLS_ASYNC_VIEWS = config('POLLS_ASYNC_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -80,9 +87,89 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # the votes of archived polls (see polls.archive), kept out of the
+    # primary; set up with `python manage.py migrate --database archive`.
+    'archive': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('POLLS_ARCHIVE_DATABASE',
+                       default=str(BASE_DIR / 'archive.sqlite3')),
+    },
+}
+
+# Read replicas of the default database, as a comma-separated list of
+# SQLite files kept in sync with the primary (e.g. by litestream). Reads go
+# to a replica and writes to the primary; clients that just wrote stay on
+# the primary for DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICA_ALIASES = []
+for number, name in enumerate(config('DATABASE_REPLICAS', default='',
+                                     cast=Csv())):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['mysite.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS',
+                                      default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Use locmem for a single process; a file-based or database cache is shared
+# between workers (run `python manage.py createcachetable` for the latter).
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND',
+                          default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ku-polls'),
     }
 }
 
+# Cache alias holding the per-question poll results.
+POLLS_RESULTS_CACHE = config('POLLS_RESULTS_CACHE', default='default')
+# Questions (with their choices) kept in memory by each worker. Workers
+# invalidate each other's copies through the default cache, so with more
+# than one worker it must be a shared backend, not locmem.
+POLLS_QUESTION_CACHE_SIZE = config('POLLS_QUESTION_CACHE_SIZE', default=1000,
+                                   cast=int)
+
+# Sessions are read from the cache and written through to the database;
+# users of sessions are resolved from POLLS_AUTH_CACHE. With several
+# workers, use a cache they share so logouts reach all of them.
+SESSION_ENGINE = config('SESSION_ENGINE',
+                        default='django.contrib.sessions.backends.cached_db')
+POLLS_AUTH_CACHE = config('POLLS_AUTH_CACHE', default='default')
+
+
+# Vote ingestion: 'sync' writes each vote immediately, 'journal' appends
+# votes to POLLS_VOTE_JOURNAL and writes them to the database in batches.
+
+POLLS_VOTE_INGESTION = config('POLLS_VOTE_INGESTION', default='sync')
+POLLS_VOTE_JOURNAL = config('POLLS_VOTE_JOURNAL',
+                            default=str(BASE_DIR / 'vote-journal.log'))
+POLLS_JOURNAL_BATCH_SIZE = config('POLLS_JOURNAL_BATCH_SIZE', default=500,
+                                  cast=int)
+POLLS_JOURNAL_FLUSH_INTERVAL = config('POLLS_JOURNAL_FLUSH_INTERVAL',
+                                      default=2.0, cast=float)
+
+# The archive_polls command moves the votes of polls closed more than this
+# many days ago out of the vote table, into the archive database.
+POLLS_ARCHIVE_AFTER_DAYS = config('POLLS_ARCHIVE_AFTER_DAYS', default=365,
+                                  cast=int)
+
+
+# Warm workers up (routes, templates, auth, databases) when they start;
+# /ready/ answers 503 until done. WARM_UP_PRIME_CACHES also loads the newest
+# open polls into the question and results caches.
+WARM_UP = config('WARM_UP', default=False, cast=bool)
+WARM_UP_PRIME_CACHES = config('WARM_UP_PRIME_CACHES', default=False,
+                              cast=bool)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -119,6 +206,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2s/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = config('STATIC_ROOT', default=str(BASE_DIR / 'staticfiles'))
+
+# collectstatic gives files hashed names and precompresses them; the
+# wsgi/asgi applications serve them (see mysite.static).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'mysite.static.CompressedManifestStaticFilesStorage',
+    },
+}
 
 
 # Default primary key field type
@@ -128,7 +227,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTHENTICATION_BACKENDS = [
     # username & password authentication
-   'django.contrib.auth.backends.ModelBackend',
+   'polls.auth.CachedModelBackend',
 ]
 LOGIN_REDIRECT_URL = 'polls:index'  # after login, show list of polls
 LOGOUT_REDIRECT_URL = 'login' # after logout redirect to login page
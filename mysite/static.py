@@ -0,0 +1,235 @@
+"""
+Static file pipeline.
+
+CompressedManifestStaticFilesStorage gives collected files content-hashed
+names and writes gzip (and, when the brotli package is installed, brotli)
+variants next to them. StaticFilesWSGI and StaticFilesASGI wrap the
+Django application and answer requests under STATIC_URL from STATIC_ROOT
+themselves, choosing the variant the client accepts, so static requests
+never reach Django's URL resolver. Hashed files are served with an
+immutable far-future Cache-Control.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions of files worth compressing; images are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json',
+                '.xml')
+# Compressed variants by Content-Encoding, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Seconds browsers keep a file whose name carries its hash.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Seconds browsers keep a file whose name does not change with it.
+MUTABLE_MAX_AGE = 60
+
+
+def compress(path):
+    """
+    Write the compressed variants of the file at `path` next to it, and
+    return their paths. A variant is skipped if it is not smaller.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data)))
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) >= len(data):
+            continue
+        with open(path + suffix, 'wb') as target:
+            target.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that precompresses the collected files, and
+    falls back to the plain name of files missing from the manifest (e.g.
+    before the first collectstatic) instead of failing the page.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            names.add(name)
+            if hashed_name:
+                names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+def accepted_encodings(header):
+    """
+    Return the content codings an Accept-Encoding header allows.
+    """
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFiles:
+    """
+    Look up the file answering a request under STATIC_URL in STATIC_ROOT,
+    with the headers to send it.
+    """
+
+    def __init__(self, root=None, prefix=None):
+        self.root = str(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+        self._immutable = None
+
+    def handles(self, path):
+        return path.startswith(self.prefix)
+
+    def immutable(self):
+        """
+        Return the names that carry the hash of their content, from the
+        manifest collectstatic wrote.
+        """
+        if self._immutable is None:
+            manifest = CompressedManifestStaticFilesStorage(location=self.root)
+            self._immutable = set(manifest.hashed_files.values())
+        return self._immutable
+
+    def find(self, path, accept_encoding='', if_modified_since=None):
+        """
+        Return (status, headers, file path or None) for a request path.
+        """
+        name = posixpath.normpath(path[len(self.prefix):]).lstrip('/')
+        try:
+            filename = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return 404, [], None
+        if not os.path.isfile(filename):
+            return 404, [], None
+        content_type, _ = mimetypes.guess_type(name)
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if name in self.immutable():
+            headers.append(('Cache-Control', f'public, max-age='
+                                             f'{IMMUTABLE_MAX_AGE}, immutable'))
+        else:
+            headers.append(('Cache-Control',
+                            f'public, max-age={MUTABLE_MAX_AGE}'))
+        modified = int(os.stat(filename).st_mtime)
+        headers.append(('Last-Modified', http_date(modified)))
+        since = parse_http_date_safe(if_modified_since or '')
+        if since is not None and modified <= since:
+            return 304, headers, None
+        accepted = accepted_encodings(accept_encoding)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(filename + suffix):
+                filename += suffix
+                headers.append(('Content-Encoding', coding))
+                break
+        headers.append(('Content-Length', str(os.path.getsize(filename))))
+        return 200, headers, filename
+
+
+STATUS_TEXT = {200: '200 OK', 304: '304 Not Modified', 404: '404 Not Found',
+               405: '405 Method Not Allowed'}
+
+
+class StaticFilesWSGI:
+    """
+    WSGI application serving STATIC_URL itself and everything else by
+    `application`.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.files = StaticFiles(root, prefix)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not self.files.handles(path):
+            return self.application(environ, start_response)
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response(STATUS_TEXT[405], [('Allow', 'GET, HEAD')])
+            return [b'']
+        status, headers, filename = self.files.find(
+            path, environ.get('HTTP_ACCEPT_ENCODING', ''),
+            environ.get('HTTP_IF_MODIFIED_SINCE'))
+        start_response(STATUS_TEXT[status], headers)
+        if filename is None or method == 'HEAD':
+            return [b'']
+        file = open(filename, 'rb')
+        wrapper = environ.get('wsgi.file_wrapper')
+        if wrapper is not None:
+            return wrapper(file)
+        with file:
+            return [file.read()]
+
+
+class StaticFilesASGI:
+    """
+    ASGI application serving STATIC_URL itself and everything else by
+    `application`.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.files = StaticFiles(root, prefix)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.files.handles(scope['path']):
+            return await self.application(scope, receive, send)
+        request_headers = {key.decode('latin-1').lower():
+                           value.decode('latin-1')
+                           for key, value in scope.get('headers', [])}
+        if scope['method'] not in ('GET', 'HEAD'):
+            status, headers, filename = 405, [('Allow', 'GET, HEAD')], None
+        else:
+            status, headers, filename = self.files.find(
+                scope['path'], request_headers.get('accept-encoding', ''),
+                request_headers.get('if-modified-since'))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.encode('latin-1'), value.encode('latin-1'))
+                        for key, value in headers],
+        })
+        body = b''
+        if filename is not None and scope['method'] == 'GET':
+            # static files are small; read them in one go.
+            with open(filename, 'rb') as file:
+                body = file.read()
+        await send({'type': 'http.response.body', 'body': body})
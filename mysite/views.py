@@ -1,8 +1,13 @@
 from django.contrib import messages
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 
+from polls.cache import question_cache, results_cache_stats
+from .metrics import registry
+from .warmup import is_ready, warm_up_report
+
 
 def signup(request):
     """Register a new user."""
@@ -26,3 +31,32 @@ def signup(request):
         # create a user form and display it the signup page
         form = UserCreationForm()
     return render(request, 'registration/signup.html', {'form': form})
+
+
+def metrics(request):
+    """Expose request metrics and cache counters for a metrics scraper."""
+    stats = results_cache_stats()
+    questions = question_cache.stats()
+    lines = [registry.render(),
+             '# TYPE polls_results_cache_hits_total counter',
+             f"polls_results_cache_hits_total {stats['hits']}",
+             '# TYPE polls_results_cache_misses_total counter',
+             f"polls_results_cache_misses_total {stats['misses']}",
+             '# TYPE polls_question_cache_hits_total counter',
+             f"polls_question_cache_hits_total {questions['hits']}",
+             '# TYPE polls_question_cache_misses_total counter',
+             f"polls_question_cache_misses_total {questions['misses']}",
+             '# TYPE polls_question_cache_size gauge',
+             f"polls_question_cache_size {questions['size']}",
+             '']
+    return HttpResponse('\n'.join(lines),
+                        content_type='text/plain; version=0.0.4')
+
+
+def ready(request):
+    """
+    Readiness probe: 503 until the worker has warmed up (settings.WARM_UP).
+    """
+    if not is_ready():
+        return JsonResponse({'ready': False}, status=503)
+    return JsonResponse({'ready': True, 'warm_up': warm_up_report()})
@@ -0,0 +1,157 @@
+"""
+Worker warm-up.
+
+Django initialises URL patterns, templates, the auth and session machinery
+and database connections lazily, so the first requests a new worker serves
+are slow. With settings.WARM_UP the wsgi/asgi applications call
+start_warm_up(), which does all of that up front in a background thread,
+and optionally fills the question and results caches with the open polls.
+The mysite.views.ready endpoint answers 503 until it is done, so a load
+balancer only sends traffic to warm workers.
+"""
+import os
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_backends, get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import URLResolver, get_resolver
+
+from polls.cache import get_results, poll_set_version, question_cache
+from polls.models import Question
+
+# Number of open polls, newest first, whose caches are primed.
+PRIME_QUESTIONS = 20
+
+_ready = threading.Event()
+_report = {}
+
+
+def is_ready():
+    """
+    Return True once warm-up has finished, or if it is not enabled.
+    """
+    return not getattr(settings, 'WARM_UP', False) or _ready.is_set()
+
+
+def warm_up_report():
+    """
+    Return what the last warm-up did, and how long it took.
+    """
+    return dict(_report)
+
+
+def warm_urls(resolver=None):
+    """
+    Compile the patterns of every route and build the reverse lookup
+    tables of every namespace. Returns the number of routes.
+    """
+    resolver = resolver or get_resolver()
+    # reading them builds the reverse lookup tables.
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        # reading it compiles the pattern.
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            count += warm_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def warm_templates():
+    """
+    Compile every template of every engine into its template cache.
+    Returns the number of templates compiled.
+    """
+    count = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for file in files:
+                    if not file.endswith(('.html', '.txt')):
+                        continue
+                    name = os.path.relpath(os.path.join(root, file),
+                                           directory).replace(os.sep, '/')
+                    try:
+                        engine.get_template(name)
+                    except (TemplateDoesNotExist, TemplateSyntaxError):
+                        # e.g. templates of apps that are not installed.
+                        continue
+                    count += 1
+    return count
+
+
+def warm_auth():
+    """
+    Import the session engine, authentication backends, user model and
+    password hasher.
+    """
+    import_module(settings.SESSION_ENGINE)
+    get_backends()
+    get_user_model()
+    get_hasher()
+
+
+def warm_databases():
+    """
+    Connect to every database once, which also checks they are reachable.
+    Returns the number of databases.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()
+    connections.close_all()
+    return len(connections.all())
+
+
+def prime_caches(count=PRIME_QUESTIONS):
+    """
+    Load the newest open polls into the question and results caches.
+    Returns the number of polls loaded.
+    """
+    poll_set_version()
+    questions = Question.objects.open().order_by('-pub_date', '-id')[:count]
+    for question in questions:
+        question_cache.get(question.pk)
+        get_results(question)
+    connections.close_all()
+    return len(questions)
+
+
+def warm_up(prime=False):
+    """
+    Run every warm-up step and mark the worker ready.
+
+    Returns:
+        dict: the number of routes, templates, databases and primed polls,
+              and the seconds it took.
+    """
+    started = time.perf_counter()
+    report = {'routes': warm_urls(), 'templates': warm_templates()}
+    warm_auth()
+    report['databases'] = warm_databases()
+    if prime:
+        report['primed_questions'] = prime_caches()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    _report.clear()
+    _report.update(report)
+    _ready.set()
+    return report
+
+
+def start_warm_up():
+    """
+    Warm the worker up in a background thread if settings.WARM_UP is on.
+    """
+    if not getattr(settings, 'WARM_UP', False):
+        return None
+    thread = threading.Thread(
+        target=warm_up, name='warm-up', daemon=True,
+        kwargs={'prime': getattr(settings, 'WARM_UP_PRIME_CACHES', False)})
+    thread.start()
+    return thread
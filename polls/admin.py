@@ -1,7 +1,103 @@
-
 from django.contrib import admin
+from django.utils import timezone
+
+from .cache import bump_poll_set_version
+from .models import Question, Choice, Vote
+
+
+class ChoiceInline(admin.TabularInline):
+    """
+    Choices edited on the page of their question.
+    """
+    model = Choice
+    extra = 1
+    fields = ['choice_text', 'vote_count']
+    readonly_fields = ['vote_count']
+
+
+class StatusListFilter(admin.SimpleListFilter):
+    """
+    Filter questions by whether they can be voted on right now, using the
+    same SQL as the index page.
+    """
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [('open', 'Open'), ('closed', 'Closed')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.open()
+        if self.value() == 'closed':
+            return queryset.closed()
+        return queryset
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    """
+    Questions with their stored vote totals, so a change list page is one
+    query however many votes the questions have.
+    """
+    list_display = ['question_text', 'pub_date', 'end_date', 'vote_total',
+                    'can_vote', 'archived_at']
+    list_filter = [StatusListFilter]
+    date_hierarchy = 'pub_date'
+    # prefix searches (case-insensitive LIKE 'term%'), which SQLite serves
+    # from the NOCASE index on question_text instead of scanning the table.
+    search_fields = ['^question_text']
+    ordering = ['-pub_date', '-id']
+    # skip counting the whole table on every page.
+    show_full_result_count = False
+    inlines = [ChoiceInline]
+    actions = ['close_polls', 'reopen_polls']
+
+    @admin.display(boolean=True, description='open')
+    def can_vote(self, question):
+        return question.can_vote()
+
+    @admin.action(description='Close selected polls now')
+    def close_polls(self, request, queryset):
+        closed = queryset.open().update(end_date=timezone.now())
+        bump_poll_set_version()
+        self.message_user(request, f'{closed} poll(s) closed.')
+
+    @admin.action(description='Reopen selected polls without an end date')
+    def reopen_polls(self, request, queryset):
+        # archived polls need their votes restored first (archive_polls
+        # --restore), or their voters could vote again.
+        reopened = (queryset.closed().filter(archived_at__isnull=True)
+                    .update(end_date=None))
+        bump_poll_set_version()
+        self.message_user(request, f'{reopened} poll(s) reopened.')
+
+
+@admin.register(Choice)
+class ChoiceAdmin(admin.ModelAdmin):
+    list_display = ['choice_text', 'question', 'vote_count']
+    list_select_related = ['question']
+    search_fields = ['^choice_text', '^question__question_text']
+    raw_id_fields = ['question']
+    readonly_fields = ['vote_count']
+    show_full_result_count = False
+
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
+    """
+    Votes can be inspected and deleted here; they are only cast through the
+    site, which keeps the tallies and the one-vote-per-question rule.
+    """
+    list_display = ['id', 'user', 'question', 'choice']
+    list_select_related = ['user', 'question', 'choice']
+    search_fields = ['^user__username']
+    raw_id_fields = ['user', 'question', 'choice']
+    ordering = ['-id']
+    show_full_result_count = False
 
-from .models import Question, Choice
+    def has_add_permission(self, request):
+        return False
 
-admin.site.register(Question)
-admin.site.register(Choice)
+    def has_change_permission(self, request, obj=None):
+        return False
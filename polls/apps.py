@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PollConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        # Connect signal handlers.
+        from . import signals  # noqa: F401
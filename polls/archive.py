@@ -0,0 +1,139 @@
+"""
+Archiving of the votes of long closed polls.
+
+The votes move to ArchivedVote, a narrower table with fewer indexes in the
+archive database (DATABASES['archive']), so the primary, its indexes and
+its replicas only hold live votes. The archive keeps the vote ids, so the
+profile pages through both and merges them, and restore_polls() moves the
+votes of a poll back on demand.
+
+The two databases do not share a transaction. Votes are copied first and
+deleted from where they came from only after the copy committed; a copy
+skips the votes already there, so a move interrupted in between is
+finished by running it again.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import ArchivedVote, Question, Vote
+from .voted import forget_voted_many
+
+# Votes copied per INSERT when moving them between tables.
+BATCH_SIZE = 1000
+
+
+def archive_polls(days=None, batch_size=BATCH_SIZE):
+    """
+    Archive the questions closed more than `days` ago (default:
+    settings.POLLS_ARCHIVE_AFTER_DAYS): move their votes from Vote to
+    ArchivedVote and mark them archived, one question per transaction.
+
+    Their stored tallies are left as they are, so they become the final
+    results the results page and the API keep showing.
+
+    Returns:
+        tuple: (number of questions, number of votes) archived.
+    """
+    if days is None:
+        days = settings.POLLS_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    # everything is read from, and written to, the primary: a replica may
+    # lag behind, and the moves must read what they delete.
+    alias = router.db_for_write(Vote)
+    pks = list(Question.objects.using(alias).closed(cutoff)
+               .filter(archived_at__isnull=True)
+               .values_list('pk', flat=True))
+    questions = votes = 0
+    for pk in pks:
+        with transaction.atomic(using=alias):
+            marked = (Question.objects.using(alias)
+                      .filter(pk=pk, archived_at__isnull=True)
+                      .update(archived_at=timezone.now()))
+            if not marked:
+                continue
+            # the copy commits to the archive before the votes are deleted.
+            moved, voters = _copy(Vote, ArchivedVote, pk, batch_size)
+            _delete(Vote, pk)
+        forget_voted_many(voters)
+        votes += moved
+        questions += 1
+    return questions, votes
+
+
+def restore_polls(question_ids, batch_size=BATCH_SIZE):
+    """
+    Move the votes of archived questions back into Vote, e.g. to reopen
+    them, and mark them as no longer archived.
+
+    Returns:
+        int: the number of votes restored.
+    """
+    alias = router.db_for_write(Vote)
+    votes = 0
+    for pk in question_ids:
+        with transaction.atomic(using=alias):
+            restored = (Question.objects.using(alias)
+                        .filter(pk=pk, archived_at__isnull=False)
+                        .update(archived_at=None))
+            if not restored:
+                continue
+            moved, voters = _copy(ArchivedVote, Vote, pk, batch_size)
+        # only once the votes are back in Vote for good.
+        _delete(ArchivedVote, pk)
+        forget_voted_many(voters)
+        votes += moved
+    return votes
+
+
+def _copy(source, model, question_id, batch_size):
+    """
+    Copy the votes on a question from the `source` model into `model` in
+    batches, each on the primary database of its model. Votes already in
+    `model` (from an interrupted move) are skipped.
+
+    Returns:
+        tuple: (number of votes copied, set of the ids of their voters).
+    """
+    fields = ('id', 'question_id', 'choice_id', 'user_id', 'voted_at')
+    target = router.db_for_write(model)
+    batch = []
+    moved = 0
+    voters = set()
+    # restored votes were rolled up before they were archived.
+    extra = {'rolled_up': True} if model is Vote else {}
+    rows = (source.objects.using(router.db_for_write(source))
+            .filter(question_id=question_id)
+            .order_by('id').values_list(*fields))
+    with transaction.atomic(using=target):
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(model(**dict(zip(fields, row)), **extra))
+            voters.add(row[3])
+            if len(batch) >= batch_size:
+                model.objects.using(target).bulk_create(
+                    batch, ignore_conflicts=True)
+                moved += len(batch)
+                batch = []
+        if batch:
+            model.objects.using(target).bulk_create(batch,
+                                                    ignore_conflicts=True)
+            moved += len(batch)
+    return moved, voters
+
+
+def _delete(model, question_id):
+    """
+    Delete the votes on a question from `model` with one DELETE.
+
+    The DELETE is issued directly, as QuerySet.delete() would send the
+    per-row deletion signals, which take deleted votes off the tallies.
+    """
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(
+        model._meta.get_field('question').column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} = %s',
+                       [question_id])
@@ -0,0 +1,154 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         StreamingHttpResponse)
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import ingest, live
+from .cache import aget_results, poll_set_version
+from .models import Choice, Question, Vote
+from .voted import avoted_map
+
+
+async def aget_user(request):
+    """
+    Resolve the user of `request` without blocking the event loop.
+
+    The resolved user is also stored on request.user, so templates and
+    context processors read it without another database query.
+    """
+    if hasattr(request, 'auser'):
+        request.user = await request.auser()
+    else:
+        # Django < 5.0 has no request.auser(); evaluate the lazy user in a
+        # worker thread instead.
+        await sync_to_async(getattr)(request.user, 'is_authenticated')
+    return request.user
+
+
+def async_login_required(view):
+    """
+    Async counterpart of login_required for async views.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(),
+                                     settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def aget_question(pk, queryset=None):
+    """
+    Return the question with primary key `pk`, raising Http404 if it is not
+    in `queryset` (default: all questions).
+    """
+    queryset = Question.objects.all() if queryset is None else queryset
+    try:
+        return await queryset.aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
+
+
+async def achoices(question):
+    """
+    Return the choices of `question` as a list.
+    """
+    return [choice async for choice in question.choice_set.all()]
+
+
+async def detail(request, pk):
+    """
+    Async view for displaying details of a question.
+    """
+    try:
+        question = await aget_question(pk, Question.objects.published())
+    except Http404:
+        return HttpResponseRedirect(reverse('polls:index'))
+    user = await aget_user(request)
+    choice_id = (await avoted_map(user)).get(question.pk)
+    choices = await achoices(question)
+    old_choice = next((choice for choice in choices
+                       if choice.pk == choice_id), None)
+    return render(request, 'polls/detail.html',
+                  {'question': question, 'choices': choices,
+                   'old_choice': old_choice})
+
+
+async def results(request, pk):
+    """
+    Async view for displaying the results of a question.
+    """
+    question = await aget_question(pk)
+    await aget_user(request)
+    return render(request, 'polls/results.html',
+                  {'question': question,
+                   'choices': await aget_results(question),
+                   'poll_set_version': await sync_to_async(poll_set_version)(),
+                   'live_results': live.can_stream(request)})
+
+
+async def results_stream(request, pk):
+    """
+    Stream the tallies of a question as Server-Sent Events: a snapshot,
+    then the changed choices whenever votes change.
+
+    Streaming needs an ASGI server; the results page only subscribes under
+    one. Under WSGI the answer is 204 No Content, which tells the browser
+    not to reconnect, so stale pages do not poll the database.
+    """
+    question = await aget_question(pk)
+    if not live.can_stream(request):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(live.stream(question.pk),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@async_login_required
+async def vote(request, question_id):
+    """
+    Async view for handling user votes on a question.
+
+    Reads run on the event loop; the vote itself is recorded in a worker
+    thread because it needs a database transaction.
+    """
+    question = await aget_question(question_id)
+    user = request.user
+
+    if not question.can_vote():
+        messages.error(request, "The poll is not available.")
+        return render(request, 'polls/detail.html',
+                      {'question': question,
+                       'choices': await achoices(question)})
+
+    try:
+        selected_choice = await question.choice_set.aget(
+            pk=request.POST['choice'])
+    except (KeyError, ValueError, Choice.DoesNotExist):
+        messages.error(request, "You didn't select a choice.")
+        return render(request, "polls/detail.html",
+                      {'question': question,
+                       'choices': await achoices(question)})
+    if ingest.is_enabled():
+        await sync_to_async(lambda: ingest.journal().append(
+            user.id, question.id, selected_choice.id))()
+        messages.success(request, f"Your vote for {selected_choice.choice_text} has been recorded "
+                                  "and will show in the results within a few seconds")
+    else:
+        vote, created = await sync_to_async(Vote.objects.record)(
+            user, selected_choice)
+        if created:
+            messages.success(request, f"Your vote for {selected_choice.choice_text} has been saved")
+        else:
+            messages.success(request, f"Change vote to {selected_choice.choice_text} has been saved")
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+# Seconds a user is kept in the cache. Saving or deleting a user removes
+# the entry; the timeout bounds how long a worker that missed it (e.g.
+# with a cache that is not shared between workers) can serve it.
+USER_TIMEOUT = 5 * 60
+
+
+def user_cache():
+    """
+    Return the cache used for authenticated users (settings.POLLS_AUTH_CACHE).
+    """
+    return caches[getattr(settings, 'POLLS_AUTH_CACHE', 'default')]
+
+
+def user_key(user_id):
+    return f'polls:user:{user_id}'
+
+
+def forget_user(user_id):
+    """
+    Remove a user from the cache, so the next request reads it again.
+    """
+    user_cache().delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that resolves the user of a session from the cache, so an
+    authenticated request does not read auth_user before its view runs.
+    The session auth hash is still checked against the cached password, so
+    a password change ends other sessions as before.
+    """
+
+    def get_user(self, user_id):
+        key = user_key(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache().set(key, user, USER_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,63 @@
+import math
+from contextlib import contextmanager
+
+from django.db import connections, router
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from .models import ArchivedVote, Vote
+
+
+def percentile(samples, percent):
+    """
+    Return the `percent` percentile of `samples` (nearest-rank method).
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """
+    Return the p50, p95 and p99 of latency samples given in seconds, in
+    milliseconds.
+    """
+    return {f'p{p}_ms': round(percentile(samples, p) * 1000, 3)
+            for p in (50, 95, 99)}
+
+
+@contextmanager
+def scratch_database(name=None, verbosity=0):
+    """
+    Run the block against freshly migrated test databases, the primary and
+    the archive, with DEBUG off as in production, so benchmarks never touch
+    real data. Reads are not routed to the replicas, which still hold the
+    real data.
+
+    Args:
+        name (str): test database name; for SQLite a file path gives a
+                    file database instead of the default in-memory one.
+                    The archive gets the same name with '.archive' added.
+    """
+    aliases = [router.db_for_write(Vote), router.db_for_write(ArchivedVote)]
+    aliases = list(dict.fromkeys(aliases))
+    if name:
+        for alias in aliases:
+            test = connections[alias].settings_dict.setdefault('TEST', {})
+            test['NAME'] = name if alias == aliases[0] else f'{name}.{alias}'
+    setup_test_environment(debug=False)
+    old_names = []
+    try:
+        for alias in aliases:
+            creation = connections[alias].creation
+            old_names.append((alias, creation.create_test_db(
+                verbosity=verbosity, autoclobber=True)))
+        with override_settings(DATABASE_REPLICA_ALIASES=[]):
+            yield connections[aliases[0]]
+    finally:
+        for alias, old_name in reversed(old_names):
+            connections[alias].creation.destroy_test_db(old_name,
+                                                        verbosity=verbosity)
+        teardown_test_environment()
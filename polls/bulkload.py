@@ -0,0 +1,262 @@
+import datetime
+import json
+import random
+import time
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .cache import bump_poll_set_version
+from .models import Choice, Question, Vote, recount_tallies
+
+# Characters read from a fixture file per read() call.
+READ_SIZE = 1 << 16
+
+# Above this many touched questions, recount all tallies in one statement
+# instead of passing a long list of ids.
+RECOUNT_ALL_THRESHOLD = 500
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    """
+    Yield the objects of a JSON array of objects read from `stream` one at
+    a time, without parsing the whole file up front.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    opened = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError("Unterminated JSON array in fixture.")
+            buffer = stream.read(read_size)
+            position = 0
+            eof = not buffer
+            continue
+        if not opened:
+            if buffer[position] != '[':
+                raise ValueError("Fixture is not a JSON array.")
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the object continues in the next chunk.
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+class BulkLoader:
+    """
+    Insert fixture-format objects ({"model", "pk", "fields"}) with
+    bulk_create in batches of `batch_size`.
+
+    Votes without a "question" field (the format before votes stored their
+    question) get it from their choice. Votes without a "voted_at" field
+    are loaded without a time, rather than the time of loading.
+    """
+
+    def __init__(self, using='default', batch_size=5000):
+        self.using = using
+        self.batch_size = batch_size
+        self.pending = {}
+        self.m2m = {}
+        self.counts = {}
+        self.choice_questions = {}
+        self.question_ids = set()
+
+    def add(self, obj):
+        """
+        Queue one fixture object, inserting its model's batch if full.
+        """
+        model = apps.get_model(obj['model'])
+        instance = model(pk=obj.get('pk'))
+        for name, value in obj['fields'].items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                if value:
+                    self.m2m.setdefault((model, name), []).append(
+                        (instance, value))
+            elif field.is_relation:
+                setattr(instance, field.attname, value)
+            else:
+                setattr(instance, field.attname, field.to_python(value))
+        if model is Choice:
+            self.choice_questions[instance.pk] = instance.question_id
+        elif model is Vote:
+            if 'voted_at' not in obj['fields']:
+                # not the time of loading; unknown, as for migrated votes.
+                instance.voted_at = None
+            if instance.question_id is None:
+                instance.question_id = self.question_of(instance.choice_id)
+            self.question_ids.add(instance.question_id)
+        batch = self.pending.setdefault(model, [])
+        batch.append(instance)
+        if len(batch) >= self.batch_size:
+            self.flush(model)
+
+    def question_of(self, choice_id):
+        if choice_id not in self.choice_questions:
+            self.choice_questions[choice_id] = (
+                Choice.objects.using(self.using)
+                .values_list('question_id', flat=True).get(pk=choice_id))
+        return self.choice_questions[choice_id]
+
+    def flush(self, model=None):
+        """
+        Insert the queued objects of `model` (default: of every model).
+        """
+        models = [model] if model else list(self.pending)
+        for model in models:
+            batch = self.pending.pop(model, [])
+            if batch:
+                model.objects.using(self.using).bulk_create(batch)
+                self.counts[model] = self.counts.get(model, 0) + len(batch)
+
+    def finish(self):
+        """
+        Insert everything still queued, the many-to-many relations, reset
+        primary key sequences and recount the tallies of touched questions.
+        """
+        self.flush()
+        for (model, name), rows in self.m2m.items():
+            through = model._meta.get_field(name).remote_field.through
+            source = f'{model._meta.model_name}_id'
+            target = [f.attname for f in through._meta.concrete_fields
+                      if f.is_relation and f.attname != source][0]
+            through.objects.using(self.using).bulk_create(
+                [through(**{source: instance.pk, target: pk})
+                 for instance, pks in rows for pk in pks])
+        connection = connections[self.using]
+        sql = connection.ops.sequence_reset_sql(no_style(), list(self.counts))
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+        if len(self.question_ids) > RECOUNT_ALL_THRESHOLD:
+            recount_tallies()
+        elif self.question_ids:
+            recount_tallies(self.question_ids)
+        if Question in self.counts or Choice in self.counts:
+            # bulk inserts send no signals to invalidate cached polls.
+            bump_poll_set_version()
+
+
+def load_files(paths, batch_size=5000, using=None, report=None):
+    """
+    Stream-parse fixture files and bulk insert their objects in a single
+    transaction.
+
+    Args:
+        paths (list): fixture files, loaded in the given order.
+        batch_size (int): objects inserted per INSERT statement.
+        using (str): database alias (default: where Vote is written).
+        report (callable): called with a line of progress per file.
+
+    Returns:
+        dict: number of objects loaded per model label.
+    """
+    using = using or router.db_for_write(Vote)
+    loader = BulkLoader(using=using, batch_size=batch_size)
+    with transaction.atomic(using=using):
+        for path in paths:
+            started = time.perf_counter()
+            count = 0
+            with open(path, encoding='utf-8') as stream:
+                for obj in iter_json_array(stream):
+                    loader.add(obj)
+                    count += 1
+            loader.flush()
+            if report:
+                elapsed = time.perf_counter() - started
+                report(f"{path}: {count} objects in {elapsed:.2f}s "
+                       f"({count / elapsed if elapsed else 0:.0f}/s)")
+        loader.finish()
+    return {model._meta.label: count
+            for model, count in loader.counts.items()}
+
+
+def zipf_weights(count, skew):
+    """
+    Return `count` weights following Zipf's law with exponent `skew`,
+    shuffled so the most popular item is not always the first.
+    """
+    weights = [1 / (rank ** skew) for rank in range(1, count + 1)]
+    random.shuffle(weights)
+    return weights
+
+
+def generate_objects(questions, choices, votes, users=None, skew=1.1,
+                     first_pk=None, now=None):
+    """
+    Yield fixture-format objects for a synthetic dataset: `users` users,
+    `questions` questions of `choices` choices each and on average `votes`
+    votes per question.
+
+    Popularity is skewed with Zipf's law both between questions and
+    between the choices of a question, as in real polls. Every user votes
+    at most once per question, at a random time while it is open.
+
+    Args:
+        first_pk (dict): first primary key per model label (default 1).
+    """
+    first_pk = first_pk or {}
+    now = now or timezone.now()
+    users = max(users or 0, votes)
+    user_pk = first_pk.get('auth.user', 1)
+    question_pk = first_pk.get('polls.question', 1)
+    choice_pk = first_pk.get('polls.choice', 1)
+    vote_pk = first_pk.get('polls.vote', 1)
+    password = make_password('generated')
+    joined = now - datetime.timedelta(days=365)
+
+    for n in range(users):
+        yield {'model': 'auth.user', 'pk': user_pk + n,
+               'fields': {'username': f'generated{user_pk + n}',
+                          'password': password, 'date_joined': joined}}
+
+    question_weights = zipf_weights(questions, skew)
+    scale = questions * votes / sum(question_weights)
+    for q in range(questions):
+        pub_date = now - datetime.timedelta(minutes=random.randint(1, 525600))
+        end_date = (None if random.random() < 0.3 else
+                    pub_date + datetime.timedelta(days=random.randint(1, 60)))
+        yield {'model': 'polls.question', 'pk': question_pk,
+               'fields': {'question_text': f'Generated question {question_pk}',
+                          'pub_date': pub_date, 'end_date': end_date}}
+        choice_ids = list(range(choice_pk, choice_pk + choices))
+        for choice_id in choice_ids:
+            yield {'model': 'polls.choice', 'pk': choice_id,
+                   'fields': {'question': question_pk,
+                              'choice_text': f'Choice {choice_id}'}}
+        vote_count = min(users, round(question_weights[q] * scale))
+        picks = random.choices(choice_ids, zipf_weights(choices, skew),
+                               k=vote_count)
+        voters = random.sample(range(user_pk, user_pk + users), vote_count)
+        open_for = min(end_date or now, now) - pub_date
+        for user_id, choice_id in zip(voters, picks):
+            yield {'model': 'polls.vote', 'pk': vote_pk,
+                   'fields': {'question': question_pk, 'choice': choice_id,
+                              'user': user_id,
+                              'voted_at': pub_date
+                              + open_for * random.random()}}
+            vote_pk += 1
+        question_pk += 1
+        choice_pk += choices
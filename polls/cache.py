@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import router
+
+from .models import Choice, Question
+
+# Seconds a cached result is kept. Entries never go stale, because a vote,
+# and adding, changing or deleting a choice, bumps the question's
+# tally_version and so changes the key; the timeout only bounds how long
+# superseded versions occupy the cache.
+RESULTS_TIMEOUT = 60 * 60
+
+# Key of the version of the set of questions and choices; part of the
+# keys of cached template fragments that show them.
+POLL_SET_VERSION_KEY = 'polls:poll_set_version'
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def results_cache():
+    """
+    Return the cache used for poll results (settings.POLLS_RESULTS_CACHE).
+    """
+    return caches[getattr(settings, 'POLLS_RESULTS_CACHE', 'default')]
+
+
+def results_key(question):
+    """
+    Return the cache key of the results of `question` at its current
+    tally version.
+    """
+    return f'polls:results:{question.pk}:{question.tally_version}'
+
+
+def poll_set_version():
+    """
+    Return the current version of the questions and choices, which changes
+    whenever one of them is saved or deleted.
+    """
+    version = cache.get(POLL_SET_VERSION_KEY)
+    if version is None:
+        # start from the clock, so versions used before the key was lost
+        # (e.g. evicted) are not reused.
+        cache.add(POLL_SET_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(POLL_SET_VERSION_KEY)
+    return version
+
+
+def bump_poll_set_version():
+    """
+    Move to a new version of the questions and choices, so cached fragments
+    showing the old ones are no longer used.
+    """
+    try:
+        cache.incr(POLL_SET_VERSION_KEY)
+    except ValueError:
+        cache.add(POLL_SET_VERSION_KEY, time.time_ns(), None)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get_results(question):
+    """
+    Return the choices of `question` with their tallies, from the cache if
+    the results for the question's tally version were already computed.
+
+    Returns:
+        list: the Choice objects of the question.
+    """
+    cache = results_cache()
+    key = results_key(question)
+    choices = cache.get(key)
+    if choices is not None:
+        _count('hits')
+        return choices
+    _count('misses')
+    choices = list(question.choice_set.all())
+    cache.set(key, choices, RESULTS_TIMEOUT)
+    return choices
+
+
+async def aget_results(question):
+    """
+    Async version of get_results() for async views.
+    """
+    cache = results_cache()
+    key = results_key(question)
+    choices = await cache.aget(key)
+    if choices is not None:
+        _count('hits')
+        return choices
+    _count('misses')
+    choices = [choice async for choice in question.choice_set.all()]
+    await cache.aset(key, choices, RESULTS_TIMEOUT)
+    return choices
+
+
+def results_cache_stats():
+    """
+    Return the hit and miss counters of the results cache in this process.
+
+    Returns:
+        dict: hits, misses and hit_rate (0.0 when nothing was looked up).
+    """
+    with _lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_rate': hits / total if total else 0.0}
+
+
+def reset_results_cache_stats():
+    """
+    Set the hit and miss counters back to zero.
+    """
+    with _lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+class QuestionCache:
+    """
+    A bounded, least-recently-used cache in this process of questions with
+    their choices, by question id.
+
+    Entries are dropped by the signals saving or deleting a question or
+    choice in this process. Other processes learn of changes through the
+    poll set version in the default cache (see poll_set_version()): when it
+    has moved since an entry was loaded, every entry is dropped. That only
+    reaches other workers if CACHES['default'] is shared between them
+    (e.g. database, file-based or memcached); with the default locmem
+    cache each worker keeps serving its copies until they are evicted.
+
+    The cached objects are shared between threads and must not be changed.
+    Their vote tallies are not kept up to date; read those from the
+    database.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pk):
+        """
+        Return (question, list of its choices) for a question id.
+
+        Raises:
+            Question.DoesNotExist: if there is no such question.
+        """
+        version = poll_set_version()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(pk)
+            if entry is not None:
+                self._entries.move_to_end(pk)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # read on the primary: an entry is loaded right after a change
+        # dropped it, which a replica may not have received yet, and is then
+        # served until the next change.
+        alias = router.db_for_write(Question)
+        question = Question.objects.using(alias).get(pk=pk)
+        entry = (question, list(Choice.objects.using(alias)
+                                .filter(question=question).order_by('pk')))
+        with self._lock:
+            if version == self._version:
+                self._entries[pk] = entry
+                self._entries.move_to_end(pk)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def forget(self, pk):
+        with self._lock:
+            self._entries.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the size of the cache and its hit and miss counters.
+
+        Returns:
+            dict: size, maxsize, hits, misses and hit_rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
+
+
+question_cache = QuestionCache(getattr(settings, 'POLLS_QUESTION_CACHE_SIZE',
+                                       1000))
@@ -0,0 +1,92 @@
+import csv
+import json
+
+from .models import ArchivedVote, Choice, Vote
+
+# Rows fetched from the database per round trip while exporting.
+CHUNK_SIZE = 2000
+
+VOTE_FIELDS = ('question_id', 'choice_id', 'user_id')
+TALLY_FIELDS = ('question_id', 'choice_id', 'choice_text', 'votes')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """
+    A file-like object whose write() returns the value instead of storing
+    it, so csv.writer can produce one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def vote_rows(question_ids=None):
+    """
+    Yield (question_id, choice_id, user_id) for every vote, reading the
+    votes in chunks so memory use does not grow with the number of votes.
+    Votes on archived questions follow the others.
+
+    Args:
+        question_ids (list): only export votes on these questions.
+    """
+    for model in (Vote, ArchivedVote):
+        votes = model.objects.order_by('pk')
+        if question_ids:
+            votes = votes.filter(question_id__in=question_ids)
+        yield from votes.values_list(*VOTE_FIELDS).iterator(
+            chunk_size=CHUNK_SIZE)
+
+
+def tally_rows(question_ids=None):
+    """
+    Yield (question_id, choice_id, choice_text, votes) for every choice.
+
+    Args:
+        question_ids (list): only export choices of these questions.
+    """
+    choices = Choice.objects.order_by('question_id', 'pk')
+    if question_ids:
+        choices = choices.filter(question_id__in=question_ids)
+    return choices.values_list('question_id', 'pk', 'choice_text',
+                               'vote_count').iterator(chunk_size=CHUNK_SIZE)
+
+
+def as_csv(fields, rows):
+    """
+    Yield `rows` as CSV lines, starting with a header of `fields`.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def as_ndjson(fields, rows):
+    """
+    Yield `rows` as newline-delimited JSON objects keyed by `fields`.
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row))) + '\n'
+
+
+def export_lines(kind, file_format, question_ids=None):
+    """
+    Return an iterator of output lines for an export.
+
+    Args:
+        kind (str): 'votes' or 'results'.
+        file_format (str): 'csv' or 'ndjson'.
+        question_ids (list): only export these questions.
+    """
+    if kind == 'votes':
+        fields, rows = VOTE_FIELDS, vote_rows(question_ids)
+    else:
+        fields, rows = TALLY_FIELDS, tally_rows(question_ids)
+    if file_format == 'ndjson':
+        return as_ndjson(fields, rows)
+    return as_csv(fields, rows)
@@ -0,0 +1,291 @@
+"""
+Write-behind ingestion of votes.
+
+With settings.POLLS_VOTE_INGESTION = 'journal' the vote view appends each
+accepted vote to an append-only journal file instead of writing to the
+database. The journal is flushed into Vote in batches, with one bulk
+upsert per batch, when POLLS_JOURNAL_BATCH_SIZE votes are pending or
+POLLS_JOURNAL_FLUSH_INTERVAL seconds have passed.
+
+A checkpoint file next to the journal records how far it has been applied.
+Applying a batch is idempotent (the last vote of a user on a question wins,
+and a vote repeating the stored choice changes nothing), so after a crash
+the journal is simply replayed from the checkpoint. Votes whose choice or
+user was deleted after they were journaled are dropped with a warning, so
+they cannot hold up the votes behind them.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Choice, Vote, bump_tally_version
+from .voted import forget_voted_on_commit
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to thread locks.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    """
+    Return True if votes are ingested through the journal.
+    """
+    return getattr(settings, 'POLLS_VOTE_INGESTION', 'sync') == 'journal'
+
+
+class VoteJournal:
+    """
+    An append-only file of accepted votes, flushed into the database.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=2.0):
+        self.path = str(path)
+        self.checkpoint_path = self.path + '.offset'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._oldest = None
+        self._timer = None
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the journal lock of this process and, where supported, an
+        exclusive lock on the journal file shared with other workers.
+        """
+        with self._lock, open(self.path, 'a+b') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield handle
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def append(self, user_id, question_id, choice_id):
+        """
+        Durably append a vote to the journal, flushing the journal if a
+        threshold has been reached.
+        """
+        record = {'user': user_id, 'question': question_id,
+                  'choice': choice_id, 'at': timezone.now().isoformat()}
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        with self._locked() as handle:
+            handle.write(line)
+            handle.flush()
+            os.fsync(handle.fileno())
+            self._pending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        if (self._pending >= self.batch_size
+                or time.monotonic() - self._oldest >= self.flush_interval):
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """
+        Make sure pending votes are flushed after flush_interval even if no
+        more votes arrive.
+        """
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval,
+                                              self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as handle:
+                return int(handle.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, offset):
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as handle:
+            handle.write(str(offset))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def flush(self):
+        """
+        Apply every journaled vote after the checkpoint to the database.
+
+        Returns:
+            int: the number of journal records applied.
+        """
+        with self._locked() as handle:
+            offset = self._read_checkpoint()
+            handle.seek(0, os.SEEK_END)
+            if offset > handle.tell():
+                # the journal was truncated after its checkpoint was saved.
+                offset = 0
+            handle.seek(offset)
+            applied = 0
+            while True:
+                batch, offset = self._read_batch(handle, offset)
+                if not batch:
+                    break
+                apply_votes(batch)
+                self._write_checkpoint(offset)
+                applied += len(batch)
+            handle.seek(0, os.SEEK_END)
+            if offset == handle.tell() and offset > 0:
+                # everything is applied, so start the journal afresh.
+                handle.truncate(0)
+                self._write_checkpoint(0)
+            self._pending = 0
+            self._oldest = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return applied
+
+    def _read_batch(self, handle, offset):
+        """
+        Read up to batch_size complete records starting at `offset`.
+
+        A trailing line without a newline is an append interrupted by a
+        crash; it is left unread.
+
+        Returns:
+            tuple: (list of records, offset after the last record read)
+        """
+        batch = []
+        while len(batch) < self.batch_size:
+            line = handle.readline()
+            if not line.endswith(b'\n'):
+                handle.seek(offset)
+                break
+            offset += len(line)
+            if line.strip():
+                batch.append(json.loads(line))
+        return batch, offset
+
+
+def apply_votes(records):
+    """
+    Write journaled votes to the database and add them to the tallies, in
+    one transaction.
+
+    The stored votes of the users on the questions are read, and locked,
+    first: only new votes and changed choices are written and counted, so
+    applying the same records twice leaves the database unchanged, which
+    makes replaying the journal after a crash safe. Records whose choice
+    no longer belongs to the question, or whose user no longer exists, are
+    dropped.
+
+    Returns:
+        int: the number of votes created or changed.
+    """
+    latest = {}
+    for record in records:
+        # records written before votes were timestamped have no time.
+        voted_at = parse_datetime(record.get('at') or '') or timezone.now()
+        latest[(record['user'], record['question'])] = (record['choice'],
+                                                        voted_at)
+    alias = router.db_for_write(Vote)
+    with transaction.atomic(using=alias):
+        questions_of = dict(
+            Choice.objects.using(alias)
+            .filter(pk__in={choice_id for choice_id, _ in latest.values()})
+            .values_list('pk', 'question_id'))
+        users = set(User.objects.using(alias)
+                    .filter(pk__in={user_id for user_id, _ in latest})
+                    .values_list('pk', flat=True))
+        for (user_id, question_id), (choice_id, _) in list(latest.items()):
+            if (questions_of.get(choice_id) != question_id
+                    or user_id not in users):
+                logger.warning(
+                    "Dropped journaled vote of user %s for choice %s of "
+                    "question %s, which no longer exists.",
+                    user_id, choice_id, question_id)
+                del latest[(user_id, question_id)]
+        if not latest:
+            return 0
+        stored = {
+            (vote.user_id, vote.question_id): vote
+            for vote in Vote.objects.using(alias).select_for_update()
+            .filter(user_id__in={user_id for user_id, _ in latest},
+                    question_id__in={question_id for _, question_id in latest})
+            .only('pk', 'user_id', 'question_id', 'choice_id')}
+        created = []
+        changed = []
+        choice_deltas = {}
+        question_deltas = {}
+        for (user_id, question_id), (choice_id, voted_at) in latest.items():
+            vote = stored.get((user_id, question_id))
+            if vote is None:
+                created.append(Vote(user_id=user_id, question_id=question_id,
+                                    choice_id=choice_id, voted_at=voted_at))
+                question_deltas[question_id] = (
+                    question_deltas.get(question_id, 0) + 1)
+            elif vote.choice_id != choice_id:
+                choice_deltas[vote.choice_id] = (
+                    choice_deltas.get(vote.choice_id, 0) - 1)
+                question_deltas.setdefault(question_id, 0)
+                vote.choice_id = choice_id
+                vote.voted_at = voted_at
+                vote.rolled_up = False
+                changed.append(vote)
+            else:
+                continue
+            choice_deltas[choice_id] = choice_deltas.get(choice_id, 0) + 1
+        Vote.objects.using(alias).bulk_create(created)
+        Vote.objects.using(alias).bulk_update(
+            changed, ['choice', 'voted_at', 'rolled_up'])
+        for choice_id, delta in choice_deltas.items():
+            if delta:
+                Choice.objects.using(alias).filter(pk=choice_id).update(
+                    vote_count=F('vote_count') + delta)
+        for question_id, delta in question_deltas.items():
+            bump_tally_version(question_id, delta)
+        forget_voted_on_commit(
+            [vote.user_id for vote in created + changed], using=alias)
+    return len(created) + len(changed)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def journal():
+    """
+    Return the vote journal of this process, replaying any votes left over
+    from a previous run the first time it is used.
+    """
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = VoteJournal(
+                settings.POLLS_VOTE_JOURNAL,
+                batch_size=settings.POLLS_JOURNAL_BATCH_SIZE,
+                flush_interval=settings.POLLS_JOURNAL_FLUSH_INTERVAL)
+            _journal.flush()
+        return _journal
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import weakref
+
+from django.db import DatabaseError
+
+from .models import Choice, Question
+
+# Seconds between checks of a question's tally version.
+POLL_INTERVAL = 1.0
+# Seconds between keep-alive comments on an idle stream.
+HEARTBEAT_INTERVAL = 15.0
+# Milliseconds a browser waits before reconnecting a closed stream.
+RETRY_MS = 3000
+
+# The feeds of each event loop, by question id.
+_feeds = weakref.WeakKeyDictionary()
+
+
+async def snapshot(question_id):
+    """
+    Return the tallies of a question as a message for subscribers.
+    """
+    question = await (Question.objects.only('tally_version', 'vote_total')
+                      .aget(pk=question_id))
+    choices = {str(choice_id): votes async for choice_id, votes in
+               Choice.objects.filter(question_id=question_id)
+               .values_list('pk', 'vote_count')}
+    return {'version': question.tally_version, 'total': question.vote_total,
+            'choices': choices}
+
+
+def can_stream(request):
+    """
+    Return True if `request` is served by an ASGI server, which can keep a
+    stream of events open without tying up a worker.
+    """
+    return 'wsgi.input' not in request.META
+
+
+def format_event(message, retry=None):
+    """
+    Return `message` as a Server-Sent Events "data:" event.
+    """
+    prefix = f'retry: {retry}\n' if retry else ''
+    return f'{prefix}data: {json.dumps(message, separators=(",", ":"))}\n\n'
+
+
+class TallyFeed:
+    """
+    The change feed of one question, shared by all subscribers in this
+    process. A single task watches the question's tally version and, when
+    it changes, sends every subscriber only the choices whose count changed.
+    """
+
+    def __init__(self, question_id, interval=POLL_INTERVAL, registry=None):
+        self.question_id = question_id
+        self.registry = registry if registry is not None else {}
+        self.interval = interval
+        self.subscribers = set()
+        self.last = None
+        self.task = None
+
+    async def subscribe(self):
+        """
+        Return a queue receiving the messages of this feed; the first one
+        is a full snapshot of the tallies.
+        """
+        queue = asyncio.Queue()
+        if self.last is None:
+            self.last = await snapshot(self.question_id)
+        queue.put_nowait(self.last)
+        self.subscribers.add(queue)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.watch())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.last = None
+            if self.registry.get(self.question_id) is self:
+                del self.registry[self.question_id]
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                version = await (Question.objects.filter(pk=self.question_id)
+                                 .values_list('tally_version', flat=True)
+                                 .afirst())
+                if version is None or version == self.last['version']:
+                    continue
+                current = await snapshot(self.question_id)
+            except DatabaseError:
+                # try again on the next tick.
+                continue
+            changed = {choice_id: votes
+                       for choice_id, votes in current['choices'].items()
+                       if self.last['choices'].get(choice_id) != votes}
+            self.last = current
+            delta = {'version': current['version'], 'total': current['total'],
+                     'choices': changed}
+            for queue in self.subscribers:
+                queue.put_nowait(delta)
+
+
+def feed(question_id):
+    """
+    Return the shared feed of a question for the running event loop.
+    """
+    feeds = _feeds.setdefault(asyncio.get_running_loop(), {})
+    if question_id not in feeds:
+        feeds[question_id] = TallyFeed(question_id, registry=feeds)
+    return feeds[question_id]
+
+
+async def stream(question_id):
+    """
+    Yield Server-Sent Events with the tallies of a question: a snapshot,
+    then a delta whenever votes change, until the client disconnects.
+    """
+    question_feed = feed(question_id)
+    queue = await question_feed.subscribe()
+    try:
+        yield format_event(await queue.get(), retry=RETRY_MS)
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(),
+                                                 HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(message)
+    finally:
+        question_feed.unsubscribe(queue)
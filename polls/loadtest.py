@@ -0,0 +1,257 @@
+"""
+In-process load generation.
+
+Virtual users drive a WSGI application directly, each in its own thread
+with its own cookies, through a scripted mix of logging in, browsing,
+voting, changing votes and refreshing results. LoadStats collects the
+latency, status and "database is locked" errors of every request per
+endpoint, and reports throughput, error rates and latency percentiles.
+"""
+import io
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connections
+
+from .benchmark import summarize
+
+# Relative weights of the actions of a virtual user after logging in:
+# many users refreshing results while fewer vote.
+DEFAULT_MIX = {'index': 10, 'detail': 15, 'vote': 5, 'change_vote': 5,
+               'results': 65}
+
+# Key of the WSGI environ naming the endpoint of a request.
+ENDPOINT_KEY = 'polls.loadtest.endpoint'
+
+# Endpoints requested while logging in, before the measured run starts.
+SETUP_ENDPOINTS = ('login_form', 'login')
+
+
+class LoadStats:
+    """
+    Per endpoint latencies, error and "database is locked" counts of a
+    load run, shared by all virtual users.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+        self.locked = {}
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.timings.setdefault(endpoint, []).append(seconds)
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def record_locked(self, endpoint):
+        with self._lock:
+            self.locked[endpoint] = self.locked.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        """
+        Return the throughput, errors and latency percentiles of the run,
+        in total and per endpoint. The logins before the run are reported
+        apart, under 'setup', without a throughput.
+        """
+        with self._lock:
+            endpoints = {}
+            setup = {}
+            for endpoint, timings in sorted(self.timings.items()):
+                errors = self.errors.get(endpoint, 0)
+                row = {
+                    'requests': len(timings),
+                    'errors': errors,
+                    'error_rate': round(errors / len(timings), 4),
+                    'database_locked': self.locked.get(endpoint, 0),
+                    **summarize(timings),
+                }
+                if endpoint in SETUP_ENDPOINTS:
+                    setup[endpoint] = row
+                else:
+                    row['throughput_rps'] = round(len(timings) / elapsed, 1)
+                    endpoints[endpoint] = row
+            total = sum(row['requests'] for row in endpoints.values())
+            return {
+                'duration_s': round(elapsed, 3),
+                'requests': total,
+                'throughput_rps': round(total / elapsed, 1),
+                'errors': sum(row['errors'] for row in endpoints.values()),
+                'database_locked': sum(row['database_locked']
+                                       for row in endpoints.values()),
+                'endpoints': endpoints,
+                'setup': setup,
+            }
+
+
+class VirtualUser:
+    """
+    A user of the site driving `application` through WSGI calls, keeping
+    its cookies (session, CSRF token) between requests.
+
+    Args:
+        questions (list): (question id, list of its choice ids) the user
+                          votes on.
+        rng (random.Random): source of the user's choices.
+    """
+
+    def __init__(self, application, username, password, questions, stats,
+                 rng):
+        self.application = application
+        self.username = username
+        self.password = password
+        self.questions = questions
+        self.stats = stats
+        self.rng = rng
+        self.cookies = {}
+        self.voted = {}
+
+    def request(self, endpoint, method, path, data=None):
+        """
+        Send one request and return its status code.
+        """
+        body = urlencode(data or {}).encode()
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            ENDPOINT_KEY: endpoint,
+        }
+        if self.cookies:
+            environ['HTTP_COOKIE'] = '; '.join(
+                f'{name}={value}' for name, value in self.cookies.items())
+        if 'csrftoken' in self.cookies:
+            environ['HTTP_X_CSRFTOKEN'] = self.cookies['csrftoken']
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split()[0])
+            started['headers'] = headers
+
+        began = time.perf_counter()
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        self.stats.record(endpoint, time.perf_counter() - began,
+                          started['status'])
+        for name, value in started['headers']:
+            if name.lower() == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    if morsel.value:
+                        self.cookies[morsel.key] = morsel.value
+                    else:
+                        self.cookies.pop(morsel.key, None)
+        return started['status']
+
+    def login(self):
+        self.request('login_form', 'GET', '/accounts/login/')
+        return self.request('login', 'POST', '/accounts/login/',
+                            {'username': self.username,
+                             'password': self.password})
+
+    def index(self):
+        return self.request('index', 'GET', '/polls/')
+
+    def detail(self):
+        question_id, _ = self.rng.choice(self.questions)
+        return self.request('detail', 'GET', f'/polls/{question_id}/')
+
+    def results(self):
+        question_id, _ = self.rng.choice(self.questions)
+        return self.request('results', 'GET', f'/polls/{question_id}/results/')
+
+    def vote(self, endpoint='vote', question=None):
+        question_id, choices = question or self.rng.choice(self.questions)
+        others = [pk for pk in choices if pk != self.voted.get(question_id)]
+        choice_id = self.rng.choice(others or choices)
+        status = self.request(endpoint, 'POST', f'/polls/{question_id}/vote/',
+                              {'choice': choice_id})
+        self.voted[question_id] = choice_id
+        return status
+
+    def change_vote(self):
+        """
+        Vote for another choice on a question already voted on.
+        """
+        voted = [question for question in self.questions
+                 if question[0] in self.voted]
+        if not voted:
+            return self.vote()
+        return self.vote('change_vote', self.rng.choice(voted))
+
+    def run(self, mix, deadline, requests=None):
+        """
+        Send requests picked by the weights of `mix` until `deadline` (a
+        time.monotonic() value) or `requests` were sent.
+        """
+        actions = list(mix)
+        weights = [mix[action] for action in actions]
+        sent = 0
+        while time.monotonic() < deadline and (requests is None
+                                               or sent < requests):
+            getattr(self, self.rng.choices(actions, weights)[0])()
+            sent += 1
+
+
+def run_load(users, mix=None, duration=10.0, requests=None):
+    """
+    Log the VirtualUser objects `users` in, then run them concurrently, one
+    thread each, for `duration` seconds, and return the report of their
+    LoadStats. Throughput is measured over the run after everyone logged
+    in.
+    """
+    mix = mix or DEFAULT_MIX
+    stats = users[0].stats
+    started = {}
+
+    def start_clock():
+        started['at'] = time.monotonic()
+
+    everyone_logged_in = threading.Barrier(len(users), action=start_clock)
+
+    def work(user):
+        try:
+            user.login()
+            everyone_logged_in.wait()
+            user.run(mix, started['at'] + duration, requests)
+        finally:
+            connections.close_all()
+
+    def count_locked(sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            stats.record_locked(request.META.get(ENDPOINT_KEY, 'unknown')
+                                if request is not None else 'unknown')
+
+    got_request_exception.connect(count_locked)
+    threads = [threading.Thread(target=work, args=(user,)) for user in users]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        got_request_exception.disconnect(count_locked)
+    return stats.report(time.monotonic() - started['at'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from polls.archive import archive_polls, restore_polls
+
+
+class Command(BaseCommand):
+    help = ("Move the votes of polls closed long ago out of the vote table "
+            "into the archive database, keeping their final results.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Archive polls closed more than this many "
+                                 "days ago (default: "
+                                 "POLLS_ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--restore', nargs='+', type=int,
+                            metavar='QUESTION_ID',
+                            help="Move the votes of these archived polls "
+                                 "back instead.")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            count = restore_polls(options['restore'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored {count} vote(s)."))
+            return
+        questions, votes = archive_polls(options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {votes} vote(s) of {questions} poll(s)."))
@@ -0,0 +1,133 @@
+import json
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.benchmark import scratch_database, summarize
+from polls.bulkload import BulkLoader, generate_objects
+from polls.models import Question, Vote
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the polls views on a seeded scratch database: SQL "
+            "queries, latency percentiles and peak memory per view.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=200,
+                            help="Average number of votes per question.")
+        parser.add_argument('--requests', type=int, default=100,
+                            help="Requests per view.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', '-o',
+                            help="Write the JSON report to this file.")
+        parser.add_argument('--baseline',
+                            help="Compare against this earlier JSON report.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed relative slowdown before a "
+                                 "metric counts as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        dataset = {key: options[key]
+                   for key in ('questions', 'choices', 'votes', 'seed')}
+        with scratch_database():
+            self.seed(dataset)
+            report = {'dataset': dataset,
+                      'views': self.run_views(options['requests'])}
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['baseline']:
+            regressions = self.compare(report, options['baseline'],
+                                       options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s).")
+
+    def seed(self, dataset):
+        loader = BulkLoader()
+        for obj in generate_objects(dataset['questions'], dataset['choices'],
+                                    dataset['votes']):
+            loader.add(obj)
+        loader.finish()
+
+    def scenarios(self):
+        """
+        Return (name, request function) for every benchmarked view.
+        """
+        question = (Question.objects.open().order_by('-vote_total').first()
+                    or Question.objects.order_by('-vote_total').first())
+        Question.objects.filter(pk=question.pk).update(end_date=None)
+        choices = list(question.choice_set.values_list('pk', flat=True))
+        # the most active voter makes the profile page the most expensive.
+        user = User.objects.get(pk=Vote.objects.values('user')
+                                .order_by().annotate(n=Count('pk'))
+                                .order_by('-n').values('user')[:1])
+        client = Client()
+        client.force_login(user)
+        vote_url = reverse('polls:vote', args=(question.pk,))
+        return [
+            ('index', lambda: client.get(reverse('polls:index'))),
+            ('detail', lambda: client.get(reverse('polls:detail',
+                                                  args=(question.pk,)))),
+            ('results', lambda: client.get(reverse('polls:results',
+                                                   args=(question.pk,)))),
+            ('vote', lambda: client.post(vote_url,
+                                         {'choice': random.choice(choices)})),
+            ('profile', lambda: client.get(reverse('polls:profile'))),
+        ]
+
+    def run_views(self, requests):
+        results = {}
+        for name, send in self.scenarios():
+            send()  # warm up templates and caches.
+            timings = []
+            queries = []
+            for _ in range(requests):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = send()
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f"{name} answered {response.status_code}.")
+            tracemalloc.start()
+            send()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = {'queries': sorted(queries)[len(queries) // 2],
+                             **summarize(timings),
+                             'peak_kb': round(peak / 1024, 1)}
+        return results
+
+    def compare(self, report, baseline_path, tolerance):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['views']
+        regressions = []
+        for name, metrics in report['views'].items():
+            for metric, value in metrics.items():
+                before = baseline.get(name, {}).get(metric)
+                if before is None:
+                    continue
+                limit = before if metric == 'queries' else before * (1 + tolerance)
+                marker = ''
+                if value > limit:
+                    regressions.append((name, metric))
+                    marker = '  <-- regression'
+                self.stderr.write(f"{name:8} {metric:8} {before:>10} -> "
+                                  f"{value:<10}{marker}")
+        return regressions
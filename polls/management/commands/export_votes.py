@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from polls.export import export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream votes or per-choice results as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only export these questions.")
+        parser.add_argument('--results', action='store_true',
+                            help="Export per-choice tallies instead of votes.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            default='csv')
+        parser.add_argument('--output', '-o',
+                            help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        kind = 'results' if options['results'] else 'votes'
+        lines = export_lines(kind, options['format'],
+                             options['question_ids'] or None)
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
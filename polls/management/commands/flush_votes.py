@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from polls import ingest
+
+
+class Command(BaseCommand):
+    help = "Write the votes waiting in the vote journal to the database."
+
+    def handle(self, *args, **options):
+        count = ingest.journal().flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"Flushed {count} journaled vote(s)."))
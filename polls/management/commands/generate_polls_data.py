@@ -0,0 +1,98 @@
+import json
+import os
+import random
+import time
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.db.models import Max
+
+from polls.bulkload import BulkLoader, generate_objects
+from polls.models import Vote
+
+# Output file of each model when writing fixtures.
+FIXTURE_FILES = {
+    'auth.user': 'users.json',
+    'polls.question': 'polls.json',
+    'polls.choice': 'polls.json',
+    'polls.vote': 'votes.json',
+}
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic dataset of N questions x M choices with "
+            "about K votes per question, into the database or fixtures.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=100,
+                            help="Average number of votes per question.")
+        parser.add_argument('--users', type=int, default=0,
+                            help="Number of users (at least --votes).")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent of question and choice "
+                                 "popularity.")
+        parser.add_argument('--seed', type=int,
+                            help="Random seed, for repeatable datasets.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--output',
+                            help="Write users.json, polls.json and votes.json "
+                                 "to this directory instead of the database.")
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        started = time.perf_counter()
+        dataset = dict(questions=options['questions'],
+                       choices=options['choices'], votes=options['votes'],
+                       users=options['users'], skew=options['skew'])
+        if options['output']:
+            counts = self.write_fixtures(options['output'], dataset)
+        else:
+            counts = self.insert(dataset, options['batch_size'])
+        total = sum(counts.values())
+        elapsed = time.perf_counter() - started
+        for label, count in counts.items():
+            self.stdout.write(f"  {label}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {total} objects in {elapsed:.2f}s "
+            f"({total / elapsed if elapsed else 0:.0f}/s)."))
+
+    def insert(self, dataset, batch_size):
+        using = router.db_for_write(Vote)
+        first_pk = {}
+        for label in FIXTURE_FILES:
+            model = apps.get_model(label)
+            last = model.objects.using(using).aggregate(last=Max('pk'))['last']
+            first_pk[label] = (last or 0) + 1
+        loader = BulkLoader(using=using, batch_size=batch_size)
+        with transaction.atomic(using=using):
+            for obj in generate_objects(first_pk=first_pk, **dataset):
+                loader.add(obj)
+            loader.finish()
+        return {model._meta.label: count
+                for model, count in loader.counts.items()}
+
+    def write_fixtures(self, directory, dataset):
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        counts = {}
+        try:
+            for name in set(FIXTURE_FILES.values()):
+                files[name] = open(os.path.join(directory, name), 'w',
+                                   encoding='utf-8')
+                files[name].write('[')
+            for obj in generate_objects(**dataset):
+                output = files[FIXTURE_FILES[obj['model']]]
+                if output.tell() > 1:
+                    output.write(',')
+                output.write('\n' + json.dumps(obj, cls=DjangoJSONEncoder))
+                counts[obj['model']] = counts.get(obj['model'], 0) + 1
+        finally:
+            for output in files.values():
+                output.write('\n]\n')
+                output.close()
+        return counts
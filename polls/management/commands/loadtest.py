@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import random
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.benchmark import scratch_database
+from polls.bulkload import BulkLoader, generate_objects
+from polls.loadtest import DEFAULT_MIX, LoadStats, VirtualUser, run_load
+from polls.models import Question
+
+
+def parse_mix(value):
+    """
+    Parse "index=10,vote=5,..." into a dict of action weights.
+    """
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action.strip() not in DEFAULT_MIX:
+            raise CommandError(f"Unknown action {action.strip()!r}; use "
+                               f"{', '.join(DEFAULT_MIX)}.")
+        try:
+            mix[action.strip()] = float(weight)
+        except ValueError:
+            raise CommandError(f"Bad weight in {part!r}.")
+    return mix
+
+
+class Command(BaseCommand):
+    help = ("Load test the site in process: concurrent virtual users log in, "
+            "browse, vote, change votes and refresh results through the "
+            "WSGI application on a seeded scratch SQLite file database. "
+            "Reports throughput, errors, 'database is locked' errors and "
+            "latency percentiles per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help="Concurrent virtual users.")
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help="Seconds to run.")
+        parser.add_argument('--requests', type=int,
+                            help="Stop each user after this many requests.")
+        parser.add_argument('--mix',
+                            default=','.join(f'{action}={weight}' for
+                                             action, weight in
+                                             DEFAULT_MIX.items()),
+                            help="Weights of the actions after login.")
+        parser.add_argument('--hot', type=int, default=10,
+                            help="Number of open polls the users vote on.")
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=100,
+                            help="Average number of votes per question.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--database',
+                            help="SQLite file for the scratch database "
+                                 "(default: a temporary file).")
+        parser.add_argument('--output', '-o',
+                            help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        random.seed(options['seed'])
+        with tempfile.TemporaryDirectory() as directory:
+            name = options['database'] or os.path.join(directory,
+                                                       'loadtest.sqlite3')
+            with scratch_database(name):
+                users = self.seed(options)
+                # imported here so the application uses the scratch database.
+                from mysite.wsgi import application
+                stats = LoadStats()
+                virtual_users = [
+                    VirtualUser(application, username, 'generated',
+                                self.hot_questions, stats,
+                                random.Random(options['seed'] + n))
+                    for n, username in enumerate(users)]
+                # the errors are counted; do not log each one.
+                request_log = logging.getLogger('django.request')
+                level = request_log.level
+                request_log.setLevel(logging.CRITICAL)
+                try:
+                    report = run_load(virtual_users, mix,
+                                      options['duration'], options['requests'])
+                finally:
+                    request_log.setLevel(level)
+        report = {'users': options['users'], 'mix': mix, **report}
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+        self.print_table(report)
+
+    def seed(self, options):
+        """
+        Load a synthetic dataset and return the usernames of the virtual
+        users.
+        """
+        loader = BulkLoader()
+        for obj in generate_objects(options['questions'], options['choices'],
+                                    options['votes'], users=options['users']):
+            loader.add(obj)
+        loader.finish()
+        hot = list(Question.objects.order_by('-vote_total')
+                   .values_list('pk', flat=True)[:options['hot']])
+        Question.objects.filter(pk__in=hot).update(end_date=None)
+        self.hot_questions = [
+            (pk, list(Question.objects.get(pk=pk).choice_set
+                      .values_list('pk', flat=True)))
+            for pk in hot]
+        return list(User.objects.order_by('pk')
+                    .values_list('username', flat=True)[:options['users']])
+
+    def print_table(self, report):
+        self.stdout.write(f"{'endpoint':12} {'requests':>8} {'rps':>8} "
+                          f"{'errors':>6} {'locked':>6} {'p50 ms':>8} "
+                          f"{'p95 ms':>8} {'p99 ms':>8}")
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:12} {row['requests']:>8} {row['throughput_rps']:>8} "
+                f"{row['errors']:>6} {row['database_locked']:>6} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+        for name, row in report['setup'].items():
+            self.stdout.write(
+                f"{name:12} {row['requests']:>8} {'(setup)':>8} "
+                f"{row['errors']:>6} {row['database_locked']:>6} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['requests']} requests in {report['duration_s']}s "
+            f"({report['throughput_rps']}/s), {report['errors']} errors, "
+            f"{report['database_locked']} 'database is locked'."))
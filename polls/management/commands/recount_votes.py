@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from polls.models import recount_tallies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored vote tallies of questions from their votes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int,
+                            help="Only recount these questions.")
+
+    def handle(self, *args, **options):
+        count = recount_tallies(options['question_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted votes for {count} question(s)."))
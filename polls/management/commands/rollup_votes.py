@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from polls.rollups import roll_up_votes
+
+
+class Command(BaseCommand):
+    help = ("Add the votes cast or changed since they were last rolled "
+            "up to the per-minute, hour and day rollups. Run it "
+            "periodically, e.g. every minute from cron.")
+
+    def handle(self, *args, **options):
+        count = roll_up_votes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {count} vote(s)."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_question_end_date_question_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'end_date'], name='polls_question_open_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_votes(apps, schema_editor):
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    # the alias being migrated, which with replicas is not the router's.
+    db_alias = schema_editor.connection.alias
+    votes = Vote.objects.using(db_alias)
+    per_choice = (votes.filter(choice=OuterRef('pk'))
+                  .order_by().values('choice').annotate(n=Count('pk'))
+                  .values('n'))
+    Choice.objects.using(db_alias).update(
+        vote_count=Coalesce(Subquery(per_choice), 0))
+    per_question = (votes.filter(choice__question=OuterRef('pk'))
+                    .order_by().values('choice__question')
+                    .annotate(n=Count('pk')).values('n'))
+    Question.objects.using(db_alias).update(
+        vote_total=Coalesce(Subquery(per_question), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_question_open_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='vote_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_votes, migrations.RunPython.noop),
+    ]
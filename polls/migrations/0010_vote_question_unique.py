@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_question_and_remove_duplicates(apps, schema_editor):
+    """
+    Copy each vote's question from its choice, then keep only the latest
+    vote of a user on a question and recount the tallies.
+    """
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    # the alias being migrated, which with replicas is not the router's.
+    db_alias = schema_editor.connection.alias
+    votes = Vote.objects.using(db_alias)
+    choices = Choice.objects.using(db_alias)
+    votes.update(question=Subquery(
+        choices.filter(pk=OuterRef('choice')).values('question')[:1]))
+    duplicates = (votes.values('user', 'question')
+                  .annotate(n=Count('pk'), latest=Max('pk')).filter(n__gt=1))
+    for row in duplicates:
+        (votes.filter(user=row['user'], question=row['question'])
+         .exclude(pk=row['latest']).delete())
+    per_choice = (votes.filter(choice=OuterRef('pk'))
+                  .order_by().values('choice').annotate(n=Count('pk'))
+                  .values('n'))
+    choices.update(vote_count=Coalesce(Subquery(per_choice), 0))
+    per_question = (votes.filter(question=OuterRef('pk'))
+                    .order_by().values('question').annotate(n=Count('pk'))
+                    .values('n'))
+    Question.objects.using(db_alias).update(
+        vote_total=Coalesce(Subquery(per_question), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_vote_tallies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(fill_question_and_remove_duplicates,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='polls_vote_one_per_user'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_vote_question_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='tally_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
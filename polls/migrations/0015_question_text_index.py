@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:34
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_vote_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(django.db.models.functions.comparison.Collate('question_text', 'NOCASE'), name='polls_question_text_idx'),
+        ),
+    ]
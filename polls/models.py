@@ -1,9 +1,41 @@
 import datetime
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Collate
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+class QuestionQuerySet(models.QuerySet):
+    """
+    QuerySet with the publishing rules of Question expressed in SQL, so
+    filtering never has to load every question into Python.
+    """
+
+    def published(self, now=None):
+        """
+        Return questions whose pub_date is not in the future.
+        """
+        now = now or timezone.now()
+        return self.filter(pub_date__lte=now)
+
+    def open(self, now=None):
+        """
+        Return questions that can be voted on right now, i.e. published and
+        either without an end_date or with an end_date not yet passed.
+        """
+        now = now or timezone.now()
+        return self.published(now).filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=now))
+
+    def closed(self, now=None):
+        """
+        Return published questions whose voting period has ended.
+        """
+        now = now or timezone.now()
+        return self.published(now).filter(end_date__lt=now)
+
+
 class Question(models.Model):
     """
     A class representing a question.
@@ -13,11 +45,31 @@ class Question(models.Model):
         pub_date (DateTime): The date and time when the question was published.
         end_date (DateTime): The date and time when the question's voting
                              period ends (optional).
+        vote_total (int): The number of votes cast on all of its choices.
+        tally_version (int): Bumped whenever a vote on the question changes,
+                             used to key cached results.
+        archived_at (DateTime): When its votes were moved to ArchivedVote;
+                                its tallies are final from then on.
     """
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('published date', default=timezone.now)
     end_date = models.DateTimeField('end published date', null=True,
                                     blank=True)
+    vote_total = models.PositiveIntegerField(default=0, editable=False)
+    tally_version = models.PositiveIntegerField(default=0, editable=False)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date', 'end_date'],
+                         name='polls_question_open_idx'),
+            # the admin's case-insensitive prefix search; SQLite only uses
+            # an index for LIKE when it has the NOCASE collation.
+            models.Index(Collate('question_text', 'NOCASE'),
+                         name='polls_question_text_idx'),
+        ]
 
     def pub_date_str(self):
         """
@@ -77,10 +129,12 @@ class Choice(models.Model):
     Attributes:
         question (Question): The question to which this choice belongs.
         choice_text (str): The text of the choice.
-        votes (int): The number of votes this choice has received.
+        vote_count (int): The number of votes this choice has received,
+                          kept up to date by Vote.objects.record().
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         """
@@ -91,15 +145,200 @@ class Choice(models.Model):
     @property
     def votes(self):
         """Return the number of votes for this choice."""
-        return self.vote_set.count()
+        return self.vote_count
+
+
+def adjust_tallies(choice_id, delta, question_id=None):
+    """
+    Add `delta` to the stored tally of a choice and, if `question_id` is
+    given, to the total of its question.
+
+    Uses F() expressions so concurrent votes never overwrite each other.
+    """
+    Choice.objects.filter(pk=choice_id).update(
+        vote_count=F('vote_count') + delta)
+    if question_id is not None:
+        bump_tally_version(question_id, delta)
+
+
+def bump_tally_version(question_id, total_delta=0):
+    """
+    Mark the tallies of a question as changed, adding `total_delta` to its
+    vote total in the same statement.
+
+    Called inside the vote transaction, so results cached under the old
+    version are never served once the vote is committed.
+    """
+    Question.objects.filter(pk=question_id).update(
+        vote_total=F('vote_total') + total_delta,
+        tally_version=F('tally_version') + 1)
+
+
+def recount_tallies(question_ids=None):
+    """
+    Rebuild the stored tallies from the Vote rows.
+
+    Args:
+        question_ids (list): only rebuild these questions (default: all).
+
+    Returns:
+        int: the number of questions whose tallies were rebuilt.
+    """
+    # archived questions have no Vote rows left; their tallies are final.
+    questions = Question.objects.filter(archived_at__isnull=True)
+    choices = Choice.objects.filter(question__archived_at__isnull=True)
+    if question_ids is not None:
+        questions = questions.filter(pk__in=question_ids)
+        choices = choices.filter(question_id__in=question_ids)
+    per_choice = (Vote.objects.filter(choice=OuterRef('pk'))
+                  .order_by().values('choice').annotate(n=Count('pk'))
+                  .values('n'))
+    per_question = (Vote.objects.filter(question=OuterRef('pk'))
+                    .order_by().values('question')
+                    .annotate(n=Count('pk')).values('n'))
+    with transaction.atomic():
+        choices.update(vote_count=Coalesce(Subquery(per_choice), 0))
+        return questions.update(
+            vote_total=Coalesce(Subquery(per_question), 0),
+            tally_version=F('tally_version') + 1)
+
+
+class VoteManager(models.Manager):
+    """
+    Manager for Vote that keeps the stored tallies in step with the votes.
+    """
+
+    def record(self, user, choice):
+        """
+        Record `user`'s vote for `choice`, replacing any earlier vote on the
+        same question, and update the tallies in the same transaction.
+
+        A new vote is a single INSERT and a changed vote a single UPDATE. If
+        a concurrent request of the same user inserts first, the unique
+        (user, question) constraint rejects our INSERT and the vote is
+        applied as an update instead, so there is never more than one vote.
+
+        Returns:
+            tuple: (vote, created) where created is False for a changed vote.
+        """
+        question_id = choice.question_id
+        with transaction.atomic():
+            vote = (self.select_for_update()
+                    .filter(question_id=question_id, user=user).first())
+            if vote is None:
+                try:
+                    with transaction.atomic():
+                        vote = self.create(choice=choice, user=user,
+                                           question_id=question_id)
+                except IntegrityError:
+                    vote = (self.select_for_update()
+                            .get(question_id=question_id, user=user))
+                else:
+                    adjust_tallies(choice.pk, 1, question_id)
+                    return vote, True
+            if vote.choice_id != choice.pk:
+                adjust_tallies(vote.choice_id, -1)
+                adjust_tallies(choice.pk, 1)
+                bump_tally_version(question_id)
+                vote.choice = choice
+                vote.voted_at = timezone.now()
+                vote.rolled_up = False
+                vote.save(update_fields=['choice', 'voted_at', 'rolled_up'])
+            return vote, False
 
 
 class Vote(models.Model):
     """
-    Record a choice for a question made by a user
+    Record a choice for a question made by a user.
+
+    A user has at most one vote per question, which the database enforces.
+    The question is stored alongside the choice so the constraint can be
+    expressed; save() fills it in from the choice. voted_at is when the
+    vote was cast or last changed, and is empty for votes cast before it
+    was recorded. rolled_up is False until polls.rollups.roll_up_votes()
+    has counted the vote as cast or last changed.
     """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    voted_at = models.DateTimeField(default=timezone.now, null=True,
+                                    editable=False)
+    rolled_up = models.BooleanField(default=False, editable=False)
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'],
+                                    name='polls_vote_one_per_user'),
+        ]
+        indexes = [
+            # only the votes waiting to be rolled up, so it stays small.
+            models.Index(fields=['voted_at'], name='polls_vote_pending_idx',
+                         condition=Q(rolled_up=False,
+                                     voted_at__isnull=False)),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Save the vote, keeping its question in step with its choice.
+        """
+        if self.choice_id is not None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} voted for {self.choice.choice_text}"
+
+
+class ArchivedVote(models.Model):
+    """
+    A vote on an archived question, moved out of Vote by
+    polls.archive.archive_polls() so the indexes every vote walks only hold
+    votes on live questions. It keeps the id of the vote, so the history of
+    a user is ordered across both tables.
+
+    Archived votes live in the archive database (see
+    mysite.db_routers.ARCHIVE_MODELS), so their foreign keys have no
+    constraint and cannot be joined: read their questions and choices with
+    a second query. They are deleted with their question or user by the
+    signals in polls.signals.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    question = models.ForeignKey(Question, on_delete=models.DO_NOTHING,
+                                 db_constraint=False)
+    choice = models.ForeignKey(Choice, on_delete=models.DO_NOTHING,
+                               db_constraint=False, db_index=False)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING,
+                             db_constraint=False, db_index=False)
+    voted_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='polls_archivedvote_user_idx'),
+        ]
+
+
+class VoteRollup(models.Model):
+    """
+    The number of votes cast for, or changed to, a choice within one
+    minute, hour or day, so vote trends are read without scanning votes.
+    Kept up to date by polls.rollups.roll_up_votes().
+    """
+    GRANULARITIES = ['minute', 'hour', 'day']
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    granularity = models.CharField(
+        max_length=6, choices=[(kind, kind) for kind in GRANULARITIES])
+    bucket = models.DateTimeField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index of a question's chart over a time range.
+            models.UniqueConstraint(
+                fields=['question', 'granularity', 'bucket', 'choice'],
+                name='polls_voterollup_bucket'),
+        ]
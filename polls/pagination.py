@@ -0,0 +1,88 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    """
+    Encode the ordering values of a row into an opaque, URL-safe cursor.
+    """
+    raw = json.dumps(list(values), cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor().
+
+    Returns:
+        list: the ordering values, or None if the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def cursor_values(model, fields, values):
+    """
+    Convert decoded cursor values to the Python types of `fields` of
+    `model`.
+
+    Returns:
+        list: the converted values, or None if there is no cursor or it
+              does not hold one valid value per field (e.g. tampered with).
+    """
+    if values is None or len(values) != len(fields):
+        return None
+    try:
+        return [model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=20):
+    """
+    Return one page of `queryset` using keyset (cursor) pagination.
+
+    Unlike OFFSET pagination the cost of a page does not grow with how deep
+    into the result set it is, because the database seeks straight to the
+    row after the cursor through the index on the ordering fields.
+
+    Args:
+        queryset: the rows to paginate.
+        ordering (tuple): field names in descending order, e.g.
+                          ('-pub_date', '-id'). The last one must be unique.
+        cursor (str): cursor returned for the previous page, if any.
+        page_size (int): maximum number of rows on a page.
+
+    Returns:
+        tuple: (list of rows, cursor for the next page or None)
+    """
+    fields = [name.lstrip('-') for name in ordering]
+    queryset = queryset.order_by(*ordering)
+    values = cursor_values(queryset.model, fields, decode_cursor(cursor))
+    if values is not None:
+        # (a, b) < (a0, b0)  <=>  a < a0 OR (a = a0 AND b < b0)
+        after = Q()
+        for i, field in enumerate(fields):
+            step = Q(**{f'{field}__lt': values[i]})
+            for previous, value in zip(fields[:i], values[:i]):
+                step &= Q(**{previous: value})
+            after |= step
+        queryset = queryset.filter(after)
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, field) for field in fields)
@@ -0,0 +1,119 @@
+import datetime
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Vote, VoteRollup
+
+# Votes counted and marked rolled up per transaction.
+BATCH_SIZE = 5000
+
+# Length of a bucket of each granularity.
+BUCKET_SIZES = {
+    'minute': datetime.timedelta(minutes=1),
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+}
+
+
+def roll_up_votes(until=None, batch_size=BATCH_SIZE):
+    """
+    Add the votes cast or changed since they were last rolled up, up to
+    `until` (default: now), to the VoteRollup buckets of every granularity,
+    and mark them rolled up.
+
+    Progress is kept on the votes, not as a time, so a vote is counted
+    however late its transaction commits or however old its voted_at is
+    (e.g. replayed from the vote journal). Only pending votes are read, by
+    their partial index, and they are locked until marked, so a vote
+    changed meanwhile is counted again on the next run.
+
+    Returns:
+        int: the number of votes rolled up.
+    """
+    until = until or timezone.now()
+    alias = router.db_for_write(Vote)
+    processed = 0
+    while True:
+        with transaction.atomic(using=alias):
+            rows = list(Vote.objects.using(alias).select_for_update()
+                        .filter(rolled_up=False, voted_at__isnull=False,
+                                voted_at__lte=until)
+                        .order_by('voted_at')
+                        .values_list('pk', 'question_id', 'choice_id',
+                                     'voted_at')[:batch_size])
+            if not rows:
+                return processed
+            for granularity in VoteRollup.GRANULARITIES:
+                _add_to_buckets(rows, granularity, alias)
+            Vote.objects.using(alias).filter(pk__in=[row[0] for row in rows]).update(
+                rolled_up=True)
+        processed += len(rows)
+
+
+def bucket_of(moment, granularity):
+    """
+    Return the start of the bucket of `granularity` holding `moment`, in UTC.
+    """
+    moment = moment.astimezone(datetime.timezone.utc).replace(
+        second=0, microsecond=0)
+    if granularity in ('hour', 'day'):
+        moment = moment.replace(minute=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _add_to_buckets(rows, granularity, alias):
+    """
+    Add the counts of the votes `rows` (id, question id, choice id,
+    voted_at) per choice and bucket to the stored rollups on `alias`.
+
+    Missing buckets are created empty first, so every bucket can be read
+    and locked on the primary before its count is added; a concurrent run
+    then waits instead of overwriting the count.
+    """
+    counts = {}
+    for _, question_id, choice_id, voted_at in rows:
+        key = (question_id, choice_id, bucket_of(voted_at, granularity))
+        counts[key] = counts.get(key, 0) + 1
+    rollups = VoteRollup.objects.using(alias)
+    rollups.bulk_create(
+        [VoteRollup(question_id=question_id, choice_id=choice_id,
+                    granularity=granularity, bucket=bucket, votes=0)
+         for question_id, choice_id, bucket in counts],
+        ignore_conflicts=True)
+    buckets = {bucket for _, _, bucket in counts}
+    changed = []
+    for rollup in rollups.select_for_update().filter(
+            granularity=granularity, bucket__gte=min(buckets),
+            bucket__lte=max(buckets),
+            question_id__in={question_id for question_id, _, _ in counts}):
+        key = (rollup.question_id, rollup.choice_id, rollup.bucket)
+        if key in counts:
+            rollup.votes += counts[key]
+            changed.append(rollup)
+    rollups.bulk_update(changed, ['votes'])
+
+
+def chart(question_id, granularity, since, until):
+    """
+    Return the rolled-up votes of a question from `since` to `until` as
+    the bucket times and, per choice id, the votes of each bucket.
+    """
+    rows = (VoteRollup.objects
+            .filter(question_id=question_id, granularity=granularity,
+                    bucket__gte=since, bucket__lte=until)
+            .order_by('bucket')
+            .values_list('bucket', 'choice_id', 'votes'))
+    buckets = []
+    series = {}
+    for bucket, choice_id, votes in rows:
+        if not buckets or buckets[-1] != bucket:
+            buckets.append(bucket)
+        points = series.setdefault(choice_id, [])
+        points.extend([0] * (len(buckets) - 1 - len(points)))
+        points.append(votes)
+    for points in series.values():
+        points.extend([0] * (len(buckets) - len(points)))
+    return buckets, series
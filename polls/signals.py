@@ -0,0 +1,97 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import forget_user
+from .cache import bump_poll_set_version, question_cache
+from .models import (ArchivedVote, Choice, Question, Vote, adjust_tallies,
+                     bump_tally_version)
+from .voted import forget_voted, forget_voted_on_commit, load_voted
+
+
+@receiver(post_delete, sender=Vote)
+def remove_deleted_vote_from_tallies(sender, instance, **kwargs):
+    """
+    Take a deleted vote (e.g. from the admin or a cascade) off the tallies
+    and the cached votes of its user.
+    """
+    adjust_tallies(instance.choice_id, -1, instance.question_id)
+    forget_voted_on_commit([instance.user_id], using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Vote)
+def vote_saved(sender, instance, **kwargs):
+    """
+    Drop the cached votes of the user of a new or changed vote.
+    """
+    forget_voted_on_commit([instance.user_id], using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def poll_set_changed(sender, instance, **kwargs):
+    """
+    Invalidate cached fragments, cached questions and, for a choice, the
+    cached results showing the changed question or choice.
+    """
+    question_cache.forget(instance.pk if sender is Question
+                          else instance.question_id)
+    if sender is Choice:
+        bump_tally_version(instance.question_id)
+    bump_poll_set_version()
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=User)
+def delete_archived_votes(sender, instance, **kwargs):
+    """
+    Delete the archived votes on a deleted question or of a deleted user
+    once the deletion commits, since the archive database cannot cascade
+    to them.
+    """
+    if sender is Question:
+        if instance.archived_at is None:
+            return
+        votes = ArchivedVote.objects.filter(question_id=instance.pk)
+    else:
+        votes = ArchivedVote.objects.filter(user_id=instance.pk)
+    transaction.on_commit(votes.delete, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    Drop a saved (e.g. new password or last login) or deleted user from the
+    cache of authenticated users.
+    """
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_in)
+@receiver(user_logged_out)
+def user_session_changed(sender, request, user, **kwargs):
+    """
+    Read the user again after logging in or out.
+    """
+    if user is not None:
+        forget_user(user.pk)
+
+
+@receiver(user_logged_in)
+def load_votes_at_login(sender, request, user, **kwargs):
+    """
+    Load the polls the user has voted in, so their pages need no vote
+    lookups.
+    """
+    load_voted(user.pk)
+
+
+@receiver(user_logged_out)
+def forget_votes_at_logout(sender, request, user, **kwargs):
+    if user is not None:
+        forget_voted(user.pk)
@@ -1,13 +1,53 @@
+import asyncio
 import datetime
+import gzip
+import json
+import os
+import random
+import tempfile
+from io import StringIO
+from unittest import mock
 
+from asgiref.sync import sync_to_async
+from django.contrib.admin import site
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.http import HttpResponse
+from django.db import (DatabaseError, IntegrityError, close_old_connections,
+                       connection, transaction)
+from django.db.models import F, Q
+from django.test import AsyncRequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
-from .models import Question, Choice, Vote
+from . import async_views
+from .benchmark import percentile, summarize
+from .bulkload import iter_json_array, load_files
+from .cache import (QuestionCache, bump_poll_set_version,
+                    reset_results_cache_stats, results_cache,
+                    results_cache_stats)
+from .ingest import VoteJournal
+from .live import TallyFeed
+from .loadtest import LoadStats, VirtualUser
+from .archive import archive_polls, restore_polls
+from .models import (ArchivedVote, Question, Choice, Vote, VoteRollup,
+                     recount_tallies)
+from .pagination import encode_cursor
+from .rollups import roll_up_votes
+from .views import PROFILE_PAGE_SIZE
 from django.urls import reverse
 import django.test
 from django.contrib.auth.models import User
 from mysite import settings
+from mysite.db_routers import (PIN_COOKIE, PrimaryPinningMiddleware,
+                               PrimaryReplicaRouter)
+from mysite import warmup
+from mysite.metrics import registry
+from mysite.static import (CompressedManifestStaticFilesStorage,
+                           StaticFilesWSGI)
+from mysite.wsgi import application
 
 
 class QuestionModelTests(TestCase):
@@ -105,6 +145,74 @@ class QuestionIndexViewIspublishTests(TestCase):
         )
 
 
+class QuestionOpenQuerySetTests(TestCase):
+    def test_open_excludes_future_and_ended_questions(self):
+        """
+        Question.objects.open() returns only questions that can be voted on.
+        """
+        question = create_question(question_text="Open.", days=-1, end=1)
+        create_question(question_text="Future.", days=1, end=2)
+        create_question(question_text="Ended.", days=-2, end=-1)
+        self.assertQuerySetEqual(Question.objects.open(), [question])
+
+    def test_same_text_questions_do_not_collide(self):
+        """
+        An ended question does not show up on the index page just because an
+        open question has the same text.
+        """
+        question = create_question(question_text="Same.", days=-1, end=1)
+        create_question(question_text="Same.", days=-2, end=-1)
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(list(response.context['latest_question_list']),
+                         [question])
+
+    def test_index_keyset_pagination(self):
+        """
+        The index page is paginated with a cursor and every open question
+        appears exactly once across the pages.
+        """
+        questions = [create_question(question_text=f"Question {n}.",
+                                     days=-n, end=1) for n in range(1, 26)]
+        response = self.client.get(reverse('polls:index'))
+        first_page = list(response.context['latest_question_list'])
+        self.assertEqual(first_page, questions[:20])
+        cursor = response.context['next_cursor']
+        self.assertIsNotNone(cursor)
+        response = self.client.get(reverse('polls:index'), {'after': cursor})
+        self.assertEqual(list(response.context['latest_question_list']),
+                         questions[20:])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_index_next_link_follows_cursor(self):
+        """
+        The cached question list drops its "Older polls" link once the
+        only older poll closes, although the polls on the page stay the
+        same.
+        """
+        for n in range(1, 21):
+            create_question(question_text=f"Question {n}.", days=-n, end=5)
+        create_question(question_text="Closing.", days=-30, end=1)
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, 'class="older"')
+        later = timezone.now() + datetime.timedelta(days=2)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(reverse('polls:index'))
+        self.assertNotContains(response, 'class="older"')
+
+    def test_index_ignores_tampered_cursor(self):
+        """
+        A cursor whose values do not fit the ordering fields shows the
+        first page instead of failing.
+        """
+        question = create_question(question_text="Question.", days=-1, end=1)
+        for values in (["abc", 1], [{}, 1], ["2020-01-01T00:00:00Z", "x"],
+                       [1]):
+            response = self.client.get(reverse('polls:index'),
+                                       {'after': encode_cursor(values)})
+            self.assertEqual(list(response.context['latest_question_list']),
+                             [question])
+
+
 def create_choice(question, choice_text):
     """
     Create a choice with the given `choice_text` and vote's number
@@ -285,8 +393,9 @@ class VoteTest(django.test.TestCase):
         If user already vote will show old choice
         """
         # Simulate the user's first vote
-        response = self.client.post(reverse('polls:vote',
-                                            args=(self.question.id,)), {'choice': self.choice.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('polls:vote',
+                                                args=(self.question.id,)), {'choice': self.choice.id})
         self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
         self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(Vote.objects.get().choice, self.choice)
@@ -308,8 +417,9 @@ class VoteTest(django.test.TestCase):
         One user can vote only once.
         """
         # Simulate the user's first vote
-        response = self.client.post(reverse('polls:vote',
-                                            args=(self.question.id,)), {'choice': self.choice.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('polls:vote',
+                                                args=(self.question.id,)), {'choice': self.choice.id})
         self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
         self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(Vote.objects.get().choice, self.choice)
@@ -328,8 +438,9 @@ class VoteTest(django.test.TestCase):
         User can change the vote by delete the old one.
         """
         # Simulate the user's first vote
-        response = self.client.post(reverse('polls:vote',
-                                            args=(self.question.id,)), {'choice': self.choice.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('polls:vote',
+                                                args=(self.question.id,)), {'choice': self.choice.id})
         self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
         self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(Vote.objects.get().choice, self.choice)
@@ -350,3 +461,1261 @@ class VoteTest(django.test.TestCase):
         self.assertEqual(len(messages), 1)
         self.assertEqual(str(messages[0]),
                          f"Change vote to {self.choice2.choice_text} has been saved")
+
+    def test_detail_page_queries(self):
+        """
+        The detail page reads the question and choices from the question
+        cache, which drops them once a choice changes.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                             {'choice': self.choice2.id})
+        detail_url = reverse('polls:detail', args=(self.question.id,))
+        # reads the user's votes again, as the vote dropped them.
+        with self.assertNumQueries(1):
+            self.client.get(detail_url)
+        # the session, user, question, choices and the user's votes all
+        # come from the caches.
+        with self.assertNumQueries(0):
+            response = self.client.get(detail_url)
+        self.assertEqual(response.context['old_choice'], self.choice2)
+        self.choice2.choice_text = "renamed"
+        self.choice2.save()
+        response = self.client.get(detail_url)
+        self.assertContains(response, "renamed")
+
+    def test_index_marks_voted_polls(self):
+        """
+        The index marks the polls the user voted in from their cached
+        votes, without rendering that mark for other users.
+        """
+        other = create_question(question_text="Other question.", days=-1,
+                                end=5)
+        self.client.get(reverse('polls:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                             {'choice': self.choice.id})
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.context['voted'], {self.question.id})
+        self.assertContains(response, 'class="voted"', count=1)
+        self.client.force_login(User.objects.create_user(username='new'))
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(response.context['voted'], set())
+        self.assertContains(response, other.question_text)
+        self.assertNotContains(response, 'class="voted"')
+
+    def test_rolled_back_vote_is_not_cached(self):
+        """
+        A vote whose transaction rolls back never reaches the cached votes.
+        """
+        detail_url = reverse('polls:detail', args=(self.question.id,))
+        self.client.get(detail_url)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Vote.objects.record(self.user, self.choice)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(self.client.get(detail_url).context['old_choice'])
+
+    def test_deleted_vote_leaves_cached_votes(self):
+        """
+        A vote deleted outside the site is no longer preselected.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                             {'choice': self.choice.id})
+        detail_url = reverse('polls:detail', args=(self.question.id,))
+        self.assertEqual(self.client.get(detail_url).context['old_choice'],
+                         self.choice)
+        with self.captureOnCommitCallbacks(execute=True):
+            Vote.objects.get(user=self.user).delete()
+        self.assertIsNone(self.client.get(detail_url).context['old_choice'])
+
+
+class VoteTallyTest(django.test.TestCase):
+    def setUp(self):
+        results_cache().clear()
+        reset_results_cache_stats()
+        self.user = User.objects.create_user(username='tally',
+                                             password='tallypassword')
+        self.question = create_question(question_text="Tally question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+        self.choice2 = create_choice(self.question, "second")
+        self.client.login(username='tally', password='tallypassword')
+
+    def vote_for(self, choice):
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                                {'choice': choice.id})
+
+    def assertTallies(self, first, second):
+        self.choice.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.choice.votes, self.choice2.votes),
+                         (first, second))
+        self.assertEqual(self.question.vote_total, first + second)
+
+    def test_vote_created_switched_and_deleted(self):
+        """
+        The stored tallies follow votes being created, changed and deleted.
+        """
+        self.vote_for(self.choice)
+        self.assertTallies(1, 0)
+        self.vote_for(self.choice2)
+        self.assertTallies(0, 1)
+        Vote.objects.get().delete()
+        self.assertTallies(0, 0)
+
+    def test_results_do_not_count_votes(self):
+        """
+        The results page reads stored tallies instead of counting votes.
+        """
+        self.vote_for(self.choice)
+        self.vote_for(self.choice2)
+        self.client.logout()
+        url = reverse('polls:results', args=(self.question.id,))
+        # one query for the question and one for its choices.
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "second")
+
+    def test_results_served_from_cache_until_next_vote(self):
+        """
+        The rendered results are cached per tally version; a vote changes
+        the version so the next view computes fresh results.
+        """
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            # just the question; the session and user come from the cache
+            # and the rendered choices from the fragment cache.
+            response = self.client.get(url)
+        self.assertContains(response, "first")
+        self.assertEqual(results_cache_stats()['misses'], 1)
+        self.vote_for(self.choice)
+        response = self.client.get(url)
+        self.assertEqual(response.context['choices'][0].votes, 1)
+        self.assertEqual(results_cache_stats()['misses'], 2)
+
+    def test_results_follow_changed_choices(self):
+        """
+        Adding, renaming or deleting a choice without votes shows on the
+        results page straight away.
+        """
+        url = reverse('polls:results', args=(self.question.id,))
+        self.client.get(url)
+        third = create_choice(self.question, "third")
+        self.assertContains(self.client.get(url), "third")
+        third.choice_text = "renamed"
+        third.save()
+        self.assertContains(self.client.get(url), "renamed")
+        third.delete()
+        self.assertNotContains(self.client.get(url), "renamed")
+
+    def test_index_list_shared_between_users(self):
+        """
+        The question list is rendered once and reused for other users,
+        while the welcome block stays per user.
+        """
+        self.client.get(reverse('polls:index'))
+        with mock.patch.object(Question, 'pub_date_str') as pub_date_str:
+            self.client.force_login(User.objects.create_user(username='new'))
+            response = self.client.get(reverse('polls:index'))
+        pub_date_str.assert_not_called()
+        self.assertContains(response, "Tally question.")
+        self.assertContains(response, "Welcome back, new")
+        self.question.question_text = "Edited."
+        self.question.save()
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Edited.")
+
+    def test_recount_votes_command(self):
+        """
+        recount_votes rebuilds tallies that have drifted from the votes.
+        """
+        self.vote_for(self.choice)
+        Choice.objects.update(vote_count=7)
+        Question.objects.update(vote_total=7)
+        call_command('recount_votes', stdout=StringIO())
+        self.assertTallies(1, 0)
+
+    def test_one_vote_per_user_per_question(self):
+        """
+        The database rejects a second vote of a user on the same question.
+        """
+        Vote.objects.create(choice=self.choice, user=self.user)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(choice=self.choice2, user=self.user)
+
+    def test_record_changes_existing_vote(self):
+        """
+        Recording a vote for a question the user already voted on changes
+        the existing vote instead of adding one.
+        """
+        first, created = Vote.objects.record(self.user, self.choice)
+        self.assertTrue(created)
+        second, created = Vote.objects.record(self.user, self.choice2)
+        self.assertFalse(created)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Vote.objects.get().question, self.question)
+        self.assertTallies(0, 1)
+
+
+class VoteJournalTest(django.test.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.journal = VoteJournal(os.path.join(self.directory.name, 'votes'),
+                                   batch_size=3, flush_interval=60)
+        self.user = User.objects.create_user(username='journal')
+        self.question = create_question(question_text="Journal question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+        self.choice2 = create_choice(self.question, "second")
+
+    def test_votes_written_in_batches(self):
+        """
+        Journaled votes reach the database once the batch size is reached,
+        and the last vote of a user on a question wins.
+        """
+        self.journal.append(self.user.id, self.question.id, self.choice.id)
+        self.journal.append(self.user.id, self.question.id, self.choice2.id)
+        self.assertFalse(Vote.objects.exists())
+        other = User.objects.create_user(username='other')
+        self.journal.append(other.id, self.question.id, self.choice2.id)
+        self.assertEqual(Vote.objects.filter(choice=self.choice2).count(), 2)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_total, 2)
+
+    def test_replay_is_idempotent(self):
+        """
+        Replaying a journal that was already applied, as after a crash
+        before the checkpoint was saved, changes nothing.
+        """
+        self.journal.append(self.user.id, self.question.id, self.choice.id)
+        with open(self.journal.path, 'rb') as handle:
+            contents = handle.read()
+        self.assertEqual(self.journal.flush(), 1)
+        Vote.objects.update(rolled_up=True)
+        with open(self.journal.path, 'wb') as handle:
+            handle.write(contents + b'{"user":')  # plus a torn append
+        os.remove(self.journal.checkpoint_path)
+        with self.assertNumQueries(5):
+            # choices, users and votes read, then the two savepoint queries;
+            # nothing is written.
+            self.assertEqual(self.journal.flush(), 1)
+        self.assertEqual(Vote.objects.count(), 1)
+        # not counted again by the rollups.
+        self.assertTrue(Vote.objects.get().rolled_up)
+        self.choice.refresh_from_db()
+        self.assertEqual(self.choice.votes, 1)
+
+    @django.test.override_settings(POLLS_VOTE_INGESTION='journal')
+    def test_vote_view_appends_to_journal(self):
+        """
+        In journal mode the vote view answers at once and queues the vote.
+        """
+        self.client.force_login(self.user)
+        with mock.patch('polls.ingest.journal', return_value=self.journal):
+            response = self.client.post(
+                reverse('polls:vote', args=(self.question.id,)),
+                {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results',
+                                               args=(self.question.id,)))
+        messages = list(get_messages(response.wsgi_request))
+        self.assertEqual(str(messages[0]),
+                         f"Your vote for {self.choice.choice_text} has been recorded "
+                         "and will show in the results within a few seconds")
+        self.assertEqual(self.journal.flush(), 1)
+        self.assertEqual(Vote.objects.get().choice, self.choice)
+
+
+class VoteJournalConstraintTest(django.test.TransactionTestCase):
+    """
+    Flushes against the database's real foreign key checks, which a
+    TestCase defers until its transaction is rolled back.
+    """
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.journal = VoteJournal(os.path.join(self.directory.name, 'votes'),
+                                   batch_size=10, flush_interval=60)
+        self.question = create_question(question_text="Journal question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+        self.users = [User.objects.create_user(username=f'journal{n}')
+                      for n in range(3)]
+
+    def test_deleted_choice_or_user_does_not_block_journal(self):
+        """
+        Votes for a choice or by a user deleted after they were journaled
+        are dropped, and the votes after them are still written.
+        """
+        doomed = create_choice(self.question, "doomed")
+        self.journal.append(self.users[0].id, self.question.id, doomed.id)
+        self.journal.append(self.users[1].id, self.question.id,
+                            self.choice.id)
+        self.journal.append(self.users[2].id, self.question.id,
+                            self.choice.id)
+        doomed.delete()
+        self.users[2].delete()
+        with self.assertLogs('polls.ingest', 'WARNING') as logs:
+            self.assertEqual(self.journal.flush(), 3)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(list(Vote.objects.values_list('user_id', flat=True)),
+                         [self.users[1].id])
+        self.assertEqual(self.journal.flush(), 0)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.vote_total, 1)
+
+
+class AsyncViewTest(django.test.TestCase):
+    def setUp(self):
+        results_cache().clear()
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(username='async')
+        self.question = create_question(question_text="Async question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+
+    def make_request(self, method, data=None, user=None):
+        request = getattr(self.factory, method)('/', data or {})
+        request.user = user or AnonymousUser()
+        request._messages = CookieStorage(request)
+        return request
+
+    async def test_async_results(self):
+        """
+        The async results view renders the stored tallies.
+        """
+        request = self.make_request('get')
+        response = await async_views.results(request, pk=self.question.pk)
+        self.assertContains(response, "first")
+
+    async def test_async_detail_redirects_unpublished(self):
+        """
+        The async detail view redirects to the index for future questions.
+        """
+        future = await Question.objects.acreate(
+            question_text="Future.",
+            pub_date=timezone.now() + datetime.timedelta(days=1))
+        request = self.make_request('get')
+        response = await async_views.detail(request, pk=future.pk)
+        self.assertEqual(response.url, reverse('polls:index'))
+
+    async def test_async_vote_and_detail_show_old_choice(self):
+        """
+        A vote through the async view is recorded and preselected on the
+        async detail page.
+        """
+        request = self.make_request('post', {'choice': self.choice.pk},
+                                    self.user)
+        response = await async_views.vote(request,
+                                          question_id=self.question.pk)
+        self.assertEqual(response.url, reverse('polls:results',
+                                               args=(self.question.pk,)))
+        self.assertEqual(await Vote.objects.acount(), 1)
+        request = self.make_request('get', user=self.user)
+        response = await async_views.detail(request, pk=self.question.pk)
+        self.assertContains(response, 'checked')
+
+    async def test_async_vote_requires_login(self):
+        """
+        Anonymous users are sent to the login page.
+        """
+        request = self.make_request('post', {'choice': self.choice.pk})
+        response = await async_views.vote(request,
+                                          question_id=self.question.pk)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+
+class ExportTest(django.test.TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter')
+        self.question = create_question(question_text="Export question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+        Vote.objects.record(self.user, self.choice)
+
+    def test_export_requires_staff(self):
+        """
+        Only staff members can download exports.
+        """
+        self.client.force_login(self.user)
+        url = reverse('polls:export_votes', args=(self.question.id,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_stream_votes_and_results(self):
+        """
+        Votes stream as CSV and results as NDJSON.
+        """
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('polls:export_votes',
+                                           args=(self.question.id,)))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['question_id,choice_id,user_id',
+                                 f'{self.question.id},{self.choice.id},{self.user.id}'])
+        response = self.client.get(reverse('polls:export_results',
+                                           args=(self.question.id,)),
+                                   {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual(rows, [{'question_id': self.question.id,
+                                 'choice_id': self.choice.id,
+                                 'choice_text': 'first', 'votes': 1}])
+
+    def test_export_votes_command(self):
+        """
+        The export_votes command writes the same lines.
+        """
+        out = StringIO()
+        call_command('export_votes', self.question.id, '--format', 'ndjson',
+                     stdout=out)
+        self.assertEqual(json.loads(out.getvalue()),
+                         {'question_id': self.question.id,
+                          'choice_id': self.choice.id,
+                          'user_id': self.user.id})
+
+
+class BulkLoadTest(django.test.TestCase):
+    def test_iter_json_array_matches_json_load(self):
+        """
+        Stream parsing a fixture yields the same objects as json.load, even
+        when objects are split across reads.
+        """
+        path = os.path.join(settings.BASE_DIR, 'data', 'polls.json')
+        with open(path, encoding='utf-8') as stream:
+            streamed = list(iter_json_array(stream, read_size=7))
+        with open(path, encoding='utf-8') as stream:
+            self.assertEqual(streamed, json.load(stream))
+
+    def test_load_sample_data(self):
+        """
+        The sample fixtures load and their tallies are counted.
+        """
+        paths = [os.path.join(settings.BASE_DIR, 'data', name)
+                 for name in ('users.json', 'polls.json', 'votes.json')]
+        call_command('load_polls_data', *paths, '--batch-size', '10',
+                     stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 7)
+        self.assertEqual(sum(Question.objects.values_list('vote_total',
+                                                          flat=True)),
+                         Vote.objects.count())
+
+    def test_load_votes_without_question(self):
+        """
+        Votes in the older format get their question from their choice.
+        """
+        question = create_question(question_text="Old format.", days=-1, end=1)
+        choice = create_choice(question, "first")
+        user = User.objects.create_user(username='old')
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as fixture:
+            json.dump([{'model': 'polls.vote', 'pk': 1,
+                        'fields': {'choice': choice.id, 'user': user.id}}],
+                      fixture)
+        self.addCleanup(os.remove, fixture.name)
+        load_files([fixture.name])
+        self.assertEqual(Vote.objects.get().question, question)
+        question.refresh_from_db()
+        self.assertEqual(question.vote_total, 1)
+
+    def test_generate_to_files_then_load(self):
+        """
+        Generated fixtures can be loaded, and every user votes at most once
+        per question.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_polls_data', '--questions', '5',
+                         '--choices', '3', '--votes', '20', '--seed', '1',
+                         '--output', directory, stdout=StringIO())
+            load_files([os.path.join(directory, name)
+                        for name in ('users.json', 'polls.json',
+                                     'votes.json')])
+        self.assertEqual(Question.objects.count(), 5)
+        self.assertEqual(Choice.objects.count(), 15)
+        self.assertGreater(Vote.objects.count(), 0)
+        self.assertEqual(sum(Choice.objects.values_list('vote_count',
+                                                        flat=True)),
+                         Vote.objects.count())
+        # votes were cast while their question was open.
+        self.assertFalse(Vote.objects.filter(
+            Q(voted_at__isnull=True)
+            | Q(voted_at__lt=F('question__pub_date'))
+            | Q(voted_at__gt=F('question__end_date'))
+            | Q(voted_at__gt=timezone.now())).exists())
+
+
+class BenchmarkHelperTest(TestCase):
+    def test_percentiles(self):
+        """
+        Percentiles use the nearest-rank method and report milliseconds.
+        """
+        samples = [n / 1000 for n in range(1, 101)]
+        self.assertEqual(percentile(samples, 50), 0.05)
+        self.assertEqual(summarize(samples),
+                         {'p50_ms': 50.0, 'p95_ms': 95.0, 'p99_ms': 99.0})
+        self.assertEqual(percentile([], 99), 0.0)
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_header(self):
+        """
+        Every response reports its database, template and total time.
+        """
+        create_question(question_text="Timed.", days=-1, end=1)
+        response = self.client.get(reverse('polls:index'))
+        timing = response['Server-Timing']
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint_has_histograms_per_view(self):
+        """
+        The metrics endpoint exposes histograms keyed by URL name.
+        """
+        self.client.get(reverse('polls:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response,
+            'polls_request_db_queries_count{view="polls:index"} 1')
+        self.assertContains(response, 'polls_question_cache_size ')
+
+
+class ProfileTest(django.test.TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='historian')
+        self.client.force_login(self.user)
+        self.open_questions = []
+        for n in range(30):
+            question = create_question(question_text=f"Open {n}.",
+                                       days=-1, end=1)
+            Vote.objects.record(self.user, create_choice(question, "yes"))
+            self.open_questions.append(question)
+        self.closed = create_question(question_text="Closed.", days=-3, end=-1)
+        Vote.objects.record(self.user, create_choice(self.closed, "no"))
+
+    def test_profile_page_queries_do_not_grow_with_votes(self):
+        """
+        A page of history costs the same number of queries however many
+        votes the user has.
+        """
+        archive_polls(days=0)
+        # caches the user and the voted polls the archiving dropped.
+        self.client.get(reverse('polls:profile'))
+        # one joined query for the page of live votes and one for the
+        # choices and questions of archived votes, which are read from the
+        # archive in one query.
+        with self.assertNumQueries(2), \
+                self.assertNumQueries(1, using='archive'):
+            response = self.client.get(reverse('polls:profile'))
+        self.assertEqual(len(response.context['user_votes']),
+                         PROFILE_PAGE_SIZE)
+        self.assertContains(response, "Closed.")
+
+    def test_history_uses_user_index(self):
+        """
+        A page of history is read newest first from the index of the user
+        foreign key, which also holds the vote id, without sorting.
+        """
+        plan = (Vote.objects.filter(user=self.user, id__lt=10)
+                .order_by('-id')[:PROFILE_PAGE_SIZE].explain())
+        self.assertIn('polls_vote_user_id', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_profile_pages_and_filters(self):
+        """
+        The history pages with a cursor and filters open or closed polls.
+        """
+        response = self.client.get(reverse('polls:profile'),
+                                   {'status': 'open'})
+        seen = [vote.question for vote in response.context['user_votes']]
+        response = self.client.get(reverse('polls:profile'),
+                                   {'status': 'open',
+                                    'after': response.context['next_cursor']})
+        seen += [vote.question for vote in response.context['user_votes']]
+        self.assertEqual(seen, self.open_questions[::-1])
+        response = self.client.get(reverse('polls:profile'),
+                                   {'status': 'closed'})
+        self.assertEqual([vote.question for vote in
+                          response.context['user_votes']], [self.closed])
+
+    def test_profile_ignores_tampered_cursor(self):
+        """
+        A cursor that is not a vote id shows the first page of history.
+        """
+        for values in (["abc"], [{}], [1, 2]):
+            response = self.client.get(reverse('polls:profile'),
+                                       {'after': encode_cursor(values)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['user_votes']),
+                             PROFILE_PAGE_SIZE)
+
+
+@django.test.override_settings(DATABASE_REPLICA_ALIASES=['replica0'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = django.test.RequestFactory()
+
+    def read_alias_during(self, request):
+        """
+        Return the alias reads are routed to while `request` is handled,
+        and the response.
+        """
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Vote))
+            return HttpResponse()
+
+        response = PrimaryPinningMiddleware(view)(request)
+        return seen[0], response
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Question), 'replica0')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+        # archived votes have a database of their own, without replicas.
+        self.assertEqual(self.router.db_for_read(ArchivedVote), 'archive')
+        self.assertEqual(self.router.db_for_write(ArchivedVote), 'archive')
+
+    def test_write_request_pins_client_to_primary(self):
+        """
+        A POST reads from the primary and keeps the client there for the
+        next requests, such as the redirect to the results page.
+        """
+        alias, response = self.read_alias_during(self.factory.post('/'))
+        self.assertEqual(alias, 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.read_alias_during(request)[0], 'default')
+        alias, response = self.read_alias_during(self.factory.get('/'))
+        self.assertEqual(alias, 'replica0')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @django.test.override_settings(
+        DATABASE_REPLICA_ALIASES=[f'replica{n}' for n in range(20)])
+    def test_request_reads_from_one_replica(self):
+        """
+        All reads of a request go to the same replica, so one page never
+        mixes replicas that lag behind by different amounts.
+        """
+        seen = []
+
+        def view(request):
+            seen.extend(self.router.db_for_read(Vote) for _ in range(20))
+            return HttpResponse()
+
+        PrimaryPinningMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(len(set(seen)), 1)
+        self.assertTrue(seen[0].startswith('replica'))
+
+
+class LiveResultsTest(django.test.TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='live')
+        self.question = create_question(question_text="Live question.",
+                                        days=-1, end=1)
+        self.choice = create_choice(self.question, "first")
+        self.choice2 = create_choice(self.question, "second")
+
+    async def test_feed_sends_snapshot_then_changed_choices(self):
+        """
+        Subscribers share one feed; after the snapshot they only receive
+        the choices whose count changed.
+        """
+        feed = TallyFeed(self.question.pk, interval=0.01)
+        first = await feed.subscribe()
+        second = await feed.subscribe()
+        snapshot = await first.get()
+        self.assertEqual(snapshot['choices'], {str(self.choice.pk): 0,
+                                               str(self.choice2.pk): 0})
+        await second.get()
+        await sync_to_async(Vote.objects.record)(self.user, self.choice2)
+        delta = await asyncio.wait_for(first.get(), 5)
+        self.assertEqual(delta['choices'], {str(self.choice2.pk): 1})
+        self.assertEqual(delta['total'], 1)
+        self.assertEqual(await asyncio.wait_for(second.get(), 5), delta)
+        feed.unsubscribe(first)
+        feed.unsubscribe(second)
+        self.assertIsNone(feed.task)
+
+    def test_no_stream_under_wsgi(self):
+        """
+        Without ASGI the results page does not subscribe to live tallies,
+        and the stream endpoint tells browsers not to reconnect.
+        """
+        response = self.client.get(reverse('polls:results',
+                                           args=(self.question.id,)))
+        self.assertNotContains(response, 'EventSource')
+        response = self.client.get(reverse('polls:results_stream',
+                                           args=(self.question.id,)))
+        self.assertEqual(response.status_code, 204)
+
+    async def test_async_results_page_subscribes(self):
+        """
+        Under ASGI the results page of an open poll streams its tallies.
+        """
+        request = AsyncRequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = await async_views.results(request, pk=self.question.pk)
+        self.assertContains(response, 'EventSource')
+
+
+# the admin renders dates in the configured time zone, which .env may omit.
+@django.test.override_settings(TIME_ZONE='UTC')
+class AdminTest(django.test.TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin')
+        self.client.force_login(self.admin)
+        self.voter = User.objects.create_user(username='voter')
+        self.open = create_question(question_text="Open.", days=-1, end=1)
+        self.closed = create_question(question_text="Closed.", days=-3,
+                                      end=-1)
+        Vote.objects.record(self.voter, create_choice(self.open, "yes"))
+
+    def test_change_lists_do_not_query_per_row(self):
+        """
+        The change lists cost the same number of queries however many rows
+        they show.
+        """
+        for n in range(10):
+            question = create_question(question_text=f"More {n}.",
+                                       days=-1, end=1)
+            Vote.objects.record(self.voter, create_choice(question, "yes"))
+        for name in ('question', 'choice', 'vote'):
+            url = reverse(f'admin:polls_{name}_changelist')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        # count, one page of rows and two for the dates; the session and
+        # user come from the cache.
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                reverse('admin:polls_question_changelist'))
+        self.assertContains(response, "More 9.")
+
+    def test_search_uses_text_index(self):
+        """
+        The prefix search of the question list ignores case and seeks in
+        the index on question_text instead of scanning the table.
+        """
+        request = django.test.RequestFactory().get('/')
+        request.user = self.admin
+        questions, _ = site._registry[Question].get_search_results(
+            request, Question.objects.all(), 'ope')
+        self.assertEqual(list(questions), [self.open])
+        self.assertIn('polls_question_text_idx', questions.explain())
+
+    def test_close_and_reopen_actions(self):
+        """
+        The bulk actions close the open polls and reopen the closed ones.
+        """
+        url = reverse('admin:polls_question_changelist')
+        selected = [self.open.pk, self.closed.pk]
+        self.client.post(url, {'action': 'close_polls',
+                               '_selected_action': selected})
+        self.assertFalse(Question.objects.open().exists())
+        self.client.post(url, {'action': 'reopen_polls',
+                               '_selected_action': selected})
+        self.assertEqual(set(Question.objects.open()),
+                         {self.open, self.closed})
+        self.assertIsNone(Question.objects.get(pk=self.closed.pk).end_date)
+
+
+class CachedAuthTest(django.test.TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached',
+                                             password='secret-pass')
+        self.client.login(username='cached', password='secret-pass')
+        self.url = reverse('polls:profile')
+
+    def test_session_and_user_served_from_cache(self):
+        """
+        Once warm, a logged in request reads neither django_session nor
+        auth_user.
+        """
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('auth_user"', tables)
+
+    def test_password_change_and_logout_invalidate(self):
+        """
+        A new password ends other sessions, and logging out ends this one,
+        even though both were cached.
+        """
+        self.client.get(self.url)
+        other = django.test.Client()
+        other.login(username='cached', password='secret-pass')
+        other.get(self.url)
+        other.post(reverse('logout'))
+        self.assertEqual(other.get(self.url).status_code, 302)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.set_password('another-pass')
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        with django.test.override_settings(STATIC_ROOT=self.root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            storage = CompressedManifestStaticFilesStorage()
+            self.hashed = storage.stored_name('polls/style.css')
+        self.app = StaticFilesWSGI(self.fail_if_called, root=self.root)
+
+    def fail_if_called(self, environ, start_response):
+        self.fail("static request reached Django")
+
+    def get(self, path, **headers):
+        """
+        Return the status, headers and body of a static request.
+        """
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **headers}
+        started = {}
+
+        def start_response(status, response_headers):
+            started['status'] = status
+            started['headers'] = dict(response_headers)
+        body = b''.join(self.app(environ, start_response))
+        return started['status'], started['headers'], body
+
+    def test_collected_files_are_hashed_and_compressed(self):
+        self.assertNotEqual(self.hashed, 'polls/style.css')
+        path = os.path.join(self.root, self.hashed)
+        with open(path, 'rb') as plain, open(path + '.gz', 'rb') as packed:
+            self.assertEqual(gzip.decompress(packed.read()), plain.read())
+
+    def test_serves_compressed_variant_with_immutable_caching(self):
+        status, headers, body = self.get(f'/static/{self.hashed}',
+                                         HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertIn(b'background', gzip.decompress(body))
+        status, headers, body = self.get('/static/polls/style.css')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertNotIn('immutable', headers['Cache-Control'])
+        self.assertIn(b'background', body)
+
+    def test_missing_and_escaping_paths_are_not_found(self):
+        for path in ('/static/polls/missing.css', '/static/../manage.py'):
+            status, _, _ = self.get(path)
+            self.assertEqual(status, '404 Not Found')
+
+
+class ResultsApiTest(django.test.TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='api')
+        self.questions = []
+        for n in range(3):
+            question = create_question(question_text=f"Api {n}.",
+                                       days=-1, end=1)
+            create_choice(question, "no")
+            Vote.objects.record(self.user, create_choice(question, "yes"))
+            self.questions.append(question)
+        self.closed = create_question(question_text="Closed.", days=-3,
+                                      end=-1)
+        self.url = reverse('polls:api_results')
+
+    def test_many_questions_in_one_query(self):
+        """
+        Results of many questions, by id or all open ones, cost one query.
+        """
+        ids = ','.join(str(q.pk) for q in self.questions + [self.closed])
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'ids': ids})
+        questions = response.json()['questions']
+        self.assertEqual([q['id'] for q in questions],
+                         [q.pk for q in self.questions + [self.closed]])
+        self.assertEqual(questions[0]['total'], 1)
+        self.assertEqual([(c['text'], c['votes'], c['percent'])
+                          for c in questions[0]['choices']],
+                         [("no", 0, 0.0), ("yes", 1, 100.0)])
+        self.assertEqual(questions[3]['choices'], [])
+        response = self.client.get(self.url, {'ids': 'open'})
+        self.assertEqual(len(response.json()['questions']), 3)
+
+    def test_fields_columns_and_etag(self):
+        """
+        Fields can be picked, laid out in columns, and revalidated by ETag.
+        """
+        response = self.client.get(self.url, {
+            'ids': 'open', 'format': 'columns', 'fields': 'total,choices',
+            'choice_fields': 'votes'})
+        payload = response.json()
+        self.assertEqual(payload['questions'],
+                         {'id': [q.pk for q in self.questions],
+                          'total': [1, 1, 1]})
+        self.assertEqual(payload['choices']['votes'], [0, 1] * 3)
+        self.assertEqual(set(payload['choices']),
+                         {'question_id', 'id', 'votes'})
+        response = self.client.get(self.url, {'ids': 'open'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(self.url, {'ids': 'open'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Vote.objects.record(self.user, self.questions[0].choice_set.first())
+        response = self.client.get(self.url, {'ids': 'open'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_bad_requests(self):
+        """
+        Missing ids, bad ids and unknown fields are rejected.
+        """
+        for params in ({}, {'ids': 'x'}, {'ids': 'open', 'fields': 'nope'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+
+
+class VoteRollupTest(django.test.TestCase):
+    def setUp(self):
+        self.question = create_question(question_text="Trend.", days=-1,
+                                        end=1)
+        self.yes = create_choice(self.question, "yes")
+        self.no = create_choice(self.question, "no")
+        self.start = timezone.now().replace(second=0, microsecond=0)
+        self.users = iter(User.objects.create_user(username=f'trend{n}')
+                          for n in range(10))
+
+    def vote_at(self, choice, minutes):
+        vote, _ = Vote.objects.record(next(self.users), choice)
+        vote.voted_at = self.start + datetime.timedelta(minutes=minutes)
+        vote.save(update_fields=['voted_at'])
+        return vote
+
+    def test_record_stamps_cast_and_changed_votes(self):
+        """
+        A vote records when it was cast and, when changed, when it was
+        changed.
+        """
+        vote = self.vote_at(self.yes, -5)
+        Vote.objects.record(vote.user, self.no)
+        vote.refresh_from_db()
+        self.assertGreater(vote.voted_at, self.start)
+
+    def test_rollups_are_incremental(self):
+        """
+        Each run only adds the votes since the previous run to the buckets.
+        """
+        self.vote_at(self.yes, 0)
+        self.vote_at(self.yes, 0)
+        self.vote_at(self.no, 1)
+        self.assertEqual(roll_up_votes(until=self.start
+                                       + datetime.timedelta(minutes=2)), 3)
+        self.vote_at(self.yes, 3)
+        self.vote_at(self.no, 3)
+        self.assertEqual(roll_up_votes(until=self.start
+                                       + datetime.timedelta(minutes=2)), 0)
+        self.assertEqual(roll_up_votes(until=self.start
+                                       + datetime.timedelta(minutes=5)), 2)
+        minutes = {(rollup.choice_id, rollup.bucket): rollup.votes
+                   for rollup in VoteRollup.objects.filter(
+                       granularity='minute')}
+        at = [self.start + datetime.timedelta(minutes=n) for n in range(4)]
+        self.assertEqual(minutes, {(self.yes.pk, at[0]): 2,
+                                   (self.no.pk, at[1]): 1,
+                                   (self.yes.pk, at[3]): 1,
+                                   (self.no.pk, at[3]): 1})
+        self.assertEqual(sum(VoteRollup.objects.filter(granularity='day')
+                             .values_list('votes', flat=True)), 5)
+
+    def test_late_votes_are_rolled_up(self):
+        """
+        A vote committed after a run with a voted_at before it (e.g. a
+        journal replay) is counted by the next run, and only once.
+        """
+        self.vote_at(self.yes, 0)
+        until = self.start + datetime.timedelta(minutes=5)
+        self.assertEqual(roll_up_votes(until=until), 1)
+        self.vote_at(self.no, 1)
+        self.assertEqual(roll_up_votes(until=until), 1)
+        self.assertEqual(roll_up_votes(until=until), 0)
+        self.assertEqual(dict(VoteRollup.objects.filter(granularity='hour')
+                              .values_list('choice_id', 'votes')),
+                         {self.yes.pk: 1, self.no.pk: 1})
+
+    def test_rollups_ignore_replicas(self):
+        """
+        Stored counts are read and added to on the primary, never on a
+        replica, which may lag behind (here, one that does not even exist).
+        """
+        self.vote_at(self.yes, 0)
+        until = self.start + datetime.timedelta(minutes=5)
+        roll_up_votes(until=until)
+        self.vote_at(self.yes, 1)
+        with django.test.override_settings(
+                DATABASE_REPLICA_ALIASES=['missing']):
+            self.assertEqual(roll_up_votes(until=until), 1)
+        self.assertEqual(VoteRollup.objects.get(granularity='day').votes, 2)
+
+    def test_chart_reads_rollups(self):
+        """
+        The chart endpoint serves the buckets of a question without reading
+        votes.
+        """
+        self.vote_at(self.yes, 0)
+        self.vote_at(self.no, 2)
+        roll_up_votes(until=self.start + datetime.timedelta(minutes=5))
+        url = reverse('polls:chart', args=(self.question.id,))
+        # question, rollups and choice labels.
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {
+                'since': self.start.isoformat(),
+                'until': (self.start
+                          + datetime.timedelta(minutes=5)).isoformat()})
+        data = response.json()
+        self.assertEqual(len(data['buckets']), 2)
+        self.assertEqual([choice['votes'] for choice in data['choices']],
+                         [[1, 0], [0, 1]])
+        response = self.client.get(url, {'granularity': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTest(django.test.TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='archivist')
+        self.client.force_login(self.user)
+        self.old = create_question(question_text="Long closed.", days=-800,
+                                   end=-700)
+        self.old_choice = create_choice(self.old, "old")
+        self.recent = create_question(question_text="Recently closed.",
+                                      days=-3, end=-1)
+        self.open = create_question(question_text="Open.", days=-1, end=1)
+        for question in (self.old, self.recent, self.open):
+            choice = (self.old_choice if question == self.old
+                      else create_choice(question, "choice"))
+            Vote.objects.record(self.user, choice)
+        Vote.objects.record(User.objects.create_user(username='other'),
+                            self.old_choice)
+
+    def test_archive_keeps_results_and_history(self):
+        """
+        Archiving moves the votes of long closed polls out of Vote, while
+        their results and the voter's history stay the same.
+        """
+        self.assertEqual(archive_polls(days=365), (1, 2))
+        self.assertFalse(Vote.objects.filter(question=self.old).exists())
+        self.assertEqual(ArchivedVote.objects.count(), 2)
+        self.assertEqual(recount_tallies(), 2)
+        response = self.client.get(reverse('polls:results',
+                                           args=(self.old.id,)))
+        self.assertEqual(response.context['choices'][0].votes, 2)
+        response = self.client.get(reverse('polls:profile'))
+        self.assertEqual([vote.question for vote in
+                          response.context['user_votes']],
+                         [self.open, self.recent, self.old])
+        # archived votes can no longer be changed.
+        self.assertContains(response, 'class="change_vote"', count=2)
+        response = self.client.get(reverse('polls:profile'),
+                                   {'status': 'closed'})
+        self.assertEqual(len(response.context['user_votes']), 2)
+        self.assertEqual(archive_polls(days=365), (0, 0))
+
+    def test_restore(self):
+        """
+        Restored votes are back in Vote with their tallies unchanged.
+        """
+        archive_polls(days=365)
+        self.assertEqual(restore_polls([self.old.pk]), 2)
+        self.assertEqual(Vote.objects.filter(question=self.old).count(), 2)
+        self.assertFalse(ArchivedVote.objects.exists())
+        recount_tallies()
+        self.old_choice.refresh_from_db()
+        self.assertEqual(self.old_choice.votes, 2)
+
+    def test_archive_ignores_replicas(self):
+        """
+        Archiving reads and deletes on the primary, never on a replica,
+        which may lag behind (here, one that does not even exist).
+        """
+        with django.test.override_settings(
+                DATABASE_REPLICA_ALIASES=['missing']):
+            self.assertEqual(archive_polls(days=365), (1, 2))
+            self.assertEqual(restore_polls([self.old.pk]), 2)
+        self.assertEqual(Vote.objects.filter(question=self.old).count(), 2)
+        self.assertFalse(ArchivedVote.objects.exists())
+
+    def test_archive_database(self):
+        """
+        Archived votes are kept in the archive database only, and deleting
+        their question or user deletes them there.
+        """
+        archive_polls(days=365)
+        self.assertNotIn(ArchivedVote._meta.db_table,
+                         connection.introspection.table_names())
+        self.assertEqual(ArchivedVote.objects.using('archive').count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username='other').delete()
+        self.assertEqual(ArchivedVote.objects.count(), 1)
+        self.old.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old.delete()
+        self.assertFalse(ArchivedVote.objects.exists())
+
+    def test_interrupted_archive_is_finished(self):
+        """
+        A move interrupted after the copy reached the archive is finished by
+        the next run, without copying the votes twice.
+        """
+        with mock.patch('polls.archive._delete', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                archive_polls(days=365)
+        self.assertEqual(ArchivedVote.objects.count(), 2)
+        self.assertEqual(Vote.objects.filter(question=self.old).count(), 2)
+        response = self.client.get(reverse('polls:profile'))
+        self.assertEqual(len(response.context['user_votes']), 3)
+        self.assertEqual(archive_polls(days=365), (1, 2))
+        self.assertEqual(ArchivedVote.objects.count(), 2)
+        self.assertFalse(Vote.objects.filter(question=self.old).exists())
+
+
+class QuestionCacheTest(django.test.TestCase):
+    def setUp(self):
+        self.questions = [create_question(question_text=f"Cached {n}.",
+                                          days=-1, end=1) for n in range(3)]
+        for question in self.questions:
+            create_choice(question, "only")
+        self.cache = QuestionCache(maxsize=2)
+
+    def test_bounded_lru_with_stats(self):
+        """
+        The cache keeps the most recently used questions up to its size and
+        counts its hits.
+        """
+        first, second, third = (q.pk for q in self.questions)
+        self.cache.get(first)
+        self.cache.get(second)
+        with self.assertNumQueries(0):
+            question, choices = self.cache.get(first)
+        self.assertEqual([c.choice_text for c in choices], ["only"])
+        self.cache.get(third)
+        with self.assertNumQueries(2):
+            self.cache.get(second)
+        self.assertEqual(self.cache.stats(), {
+            'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 4,
+            'hit_rate': 0.2})
+        with self.assertRaises(Question.DoesNotExist):
+            self.cache.get(0)
+
+    def test_invalidated_by_other_processes(self):
+        """
+        A change announced through the shared poll set version (e.g. by
+        another worker) empties the cache.
+        """
+        pk = self.questions[0].pk
+        self.cache.get(pk)
+        Question.objects.filter(pk=pk).update(question_text="Changed.")
+        bump_poll_set_version()
+        question, _ = self.cache.get(pk)
+        self.assertEqual(question.question_text, "Changed.")
+
+    def test_loads_from_primary(self):
+        """
+        Entries are loaded from the primary, never from a replica, which
+        may lag behind (here, one that does not even exist).
+        """
+        with django.test.override_settings(
+                DATABASE_REPLICA_ALIASES=['missing']):
+            question, choices = self.cache.get(self.questions[0].pk)
+        self.assertEqual(question, self.questions[0])
+        self.assertEqual(len(choices), 1)
+
+
+class LoadTestUserTest(django.test.TestCase):
+    def setUp(self):
+        User.objects.create_user(username='virtual', password='secret-pass')
+        self.question = create_question(question_text="Load.", days=-1,
+                                        end=1)
+        self.choices = [create_choice(self.question, text).pk
+                        for text in ("a", "b")]
+        # calling the application directly would close the connection of
+        # the test transaction at the end of each request.
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def test_virtual_user_votes_through_wsgi(self):
+        """
+        A virtual user logs in, votes and changes its vote through the WSGI
+        application, and every request is counted per endpoint.
+        """
+        stats = LoadStats()
+        user = VirtualUser(application, 'virtual', 'secret-pass',
+                           [(self.question.pk, self.choices)], stats,
+                           random.Random(1))
+        self.assertEqual(user.login(), 302)
+        self.assertEqual(user.vote(), 302)
+        self.assertEqual(user.change_vote(), 302)
+        user.run({'results': 1, 'index': 1}, deadline=float('inf'),
+                 requests=4)
+        vote = Vote.objects.get(user__username='virtual')
+        self.assertEqual(vote.choice_id, user.voted[self.question.pk])
+        report = stats.report(elapsed=1.0)
+        # the two login requests are reported apart from the run.
+        self.assertEqual(report['requests'], 6)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['endpoints']['change_vote']['requests'], 1)
+        self.assertEqual(report['setup']['login']['requests'], 1)
+        self.assertNotIn('throughput_rps', report['setup']['login'])
+
+
+class WarmUpTest(TestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.addCleanup(warmup._ready.clear)
+        warmup._ready.clear()
+
+    def test_ready_only_after_warm_up(self):
+        """
+        With WARM_UP on, /ready/ answers 503 until the warm-up thread has
+        resolved the routes, compiled the templates and primed the caches.
+        """
+        with django.test.override_settings(WARM_UP=True,
+                                           WARM_UP_PRIME_CACHES=True):
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 503)
+            warmup.start_warm_up().join()
+            response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()['warm_up']
+        self.assertGreater(report['routes'], 10)
+        self.assertGreater(report['templates'], 5)
+        self.assertIn('primed_questions', report)
+
+    def test_ready_without_warm_up(self):
+        self.assertIsNone(warmup.start_warm_up())
+        self.assertEqual(self.client.get(reverse('ready')).status_code, 200)
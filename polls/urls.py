@@ -1,10 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'polls'
+
+if settings.POLLS_ASYNC_VIEWS:
+    # native async views for ASGI deployments.
+    detail_view = async_views.detail
+    results_view = async_views.results
+    vote_view = async_views.vote
+else:
+    detail_view = views.DetailView.as_view()
+    results_view = views.ResultsView.as_view()
+    vote_view = views.vote
+
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
-    path('<int:pk>/', views.DetailView.as_view(), name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
-    path('profile/', views.profile, name='profile')]
+    path('<int:pk>/', detail_view, name='detail'),
+    path('<int:pk>/results/', results_view, name='results'),
+    path('<int:pk>/results/stream/', async_views.results_stream,
+         name='results_stream'),
+    path('<int:question_id>/vote/', vote_view, name='vote'),
+    path('<int:pk>/chart/', views.chart, name='chart'),
+    path('<int:pk>/export/votes/', views.export, {'kind': 'votes'},
+         name='export_votes'),
+    path('<int:pk>/export/results/', views.export, {'kind': 'results'},
+         name='export_results'),
+    path('profile/', views.profile, name='profile'),
+    path('api/results/', views.results_api, name='api_results')]
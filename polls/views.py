@@ -1,76 +1,131 @@
-from django.http import HttpResponseRedirect,Http404
-from .models import Question, Choice, Vote
+import datetime
+import hashlib
+import itertools
+import json
+
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         HttpResponseRedirect, Http404, JsonResponse,
+                         StreamingHttpResponse)
+from .models import ArchivedVote, Choice, Question, Vote
+from . import ingest, live
+from .cache import get_results, poll_set_version, question_cache
+from .export import CONTENT_TYPES, export_lines
+from .pagination import encode_cursor, keyset_page
+from .rollups import BUCKET_SIZES, chart as rollup_chart
+from .voted import voted_map
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
 from django.views import generic
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import SimpleLazyObject
 from django.contrib import messages
 
 
+# Votes shown per page of the profile history.
+PROFILE_PAGE_SIZE = 25
+# Most questions one request to the results API may ask for by id.
+API_MAX_QUESTIONS = 500
+# Fields of a question and of a choice the results API can return.
+API_QUESTION_FIELDS = ('text', 'total', 'choices')
+API_CHOICE_FIELDS = ('text', 'votes', 'percent')
+# Most buckets one vote trend chart may span.
+CHART_MAX_BUCKETS = 1440
+
+
 class IndexView(generic.ListView):
     """
     View for displaying a list of the latest published questions.
     """
     template_name = 'polls/index.html'
     context_object_name = 'latest_question_list'
+    page_size = 20
 
     def get_queryset(self):
         """
-        Return the last five published questions (not including those set to be
-        published in the future).
+        Return a page of the questions that are open for voting (not including
+        those set to be published in the future or already ended), newest
+        first. Paging uses a cursor on (pub_date, id) taken from ?after=.
         """
-        all_questions = Question.objects.all()
-        # Check if the question is published recently and can be voted on.
-        question = [q for q in all_questions if q.is_published() and q.can_vote()]
-        # Sort and select the last 5 questions.
-        return Question.objects.filter(question_text__in=question).order_by("-pub_date")
+        questions, self.next_cursor = keyset_page(
+            Question.objects.open(), ('-pub_date', '-id'),
+            cursor=self.request.GET.get('after'), page_size=self.page_size)
+        return questions
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the cursor of the next page, the polls on it the user has voted
+        in, and the keys of the cached fragment rendering this page (which
+        include the cursor, as the fragment links to the next page). The
+        fragment is shared by all users who voted in the same polls on it.
+        """
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        context['poll_set_version'] = poll_set_version()
+        questions = context['latest_question_list']
+        context['list_key'] = ','.join(str(question.pk)
+                                       for question in questions)
+        voted = voted_map(self.request.user)
+        context['voted'] = {question.pk for question in questions
+                            if question.pk in voted}
+        context['voted_key'] = ','.join(str(pk)
+                                        for pk in sorted(context['voted']))
+        return context
 
 
 class DetailView(generic.DetailView):
     """
     View for displaying details of a question.
+
+    The question and its choices come from the in-process question cache
+    and the user's earlier choice from their cached votes, so a page view
+    usually needs no query.
     """
     model = Question
     template_name = 'polls/detail.html'
 
-
-    def get_queryset(self):
+    def get_object(self, queryset=None):
         """
-        Excludes any questions that aren't published yet.
+        Return the question if it is published, fetching it only once per
+        request.
         """
-        all_questions = Question.objects.all()
-        # Check if the question is published recently.
-        question = [q for q in all_questions if q.is_published()]
-
-        return Question.objects.filter(question_text__in=question)
+        if not hasattr(self, '_question'):
+            try:
+                self._question, self._choices = question_cache.get(
+                    self.kwargs['pk'])
+            except Question.DoesNotExist:
+                raise Http404("No question found matching the query")
+            if not self._question.is_published():
+                raise Http404("No question found matching the query")
+        return self._question
 
     def get(self, request, *args, **kwargs):
         # Check if the object exists
         try:
-            self.get_object()
+            self.object = self.get_object()
         except Http404:
             return HttpResponseRedirect(reverse('polls:index'))  # Redirect to the index page
-        #still go to detail page
-        return super().get(request, *args, **kwargs)
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
 
-    def get_old_choice(self):
-
-        user = self.request.user
-        if user == AnonymousUser():
-            return None
-
-        question = self.get_object()
-        votes = Vote.objects.filter(choice__question=question, user=user)
-        if votes.exists():
-            return votes.first().choice
-        else:
-            return None
+    def get_old_choice(self, choices):
+        """
+        Return the choice among `choices` the user voted for, or None.
+        """
+        choice_id = voted_map(self.request.user).get(self.object.pk)
+        for choice in choices:
+            if choice.id == choice_id:
+                return choice
+        return None
 
     def get_context_data(self, **kwargs):
 
         context = super().get_context_data(**kwargs)
-        context['old_choice'] = self.get_old_choice()
+        context['choices'] = self._choices
+        context['old_choice'] = self.get_old_choice(context['choices'])
         return context
 
 
@@ -81,50 +136,284 @@ class ResultsView(generic.DetailView):
     model = Question
     template_name = 'polls/results.html'
 
+    def get_context_data(self, **kwargs):
+        """
+        Add the choices of the question with their stored vote tallies, so
+        the page is rendered without counting any votes. The choices come
+        from the results cache when the tallies have not changed, and are
+        only fetched if the cached fragment showing them is out of date.
+        The page subscribes to live tallies when served over ASGI.
+        """
+        context = super().get_context_data(**kwargs)
+        context['poll_set_version'] = poll_set_version()
+        context['choices'] = SimpleLazyObject(
+            lambda: get_results(self.object))
+        context['live_results'] = live.can_stream(self.request)
+        return context
+
 
 @login_required
 def vote(request, question_id):
     """
     View for handling user votes on a question.
     """
-    question = get_object_or_404(Question, pk=question_id)
+    try:
+        question, choices = question_cache.get(question_id)
+    except Question.DoesNotExist:
+        raise Http404("No question found matching the query")
     user = request.user
-    print("current user is", user.id, "login", user.username)
-    print("Real name:", user.first_name, user.last_name)
 
     if not question.can_vote():
         # User cannot vote on this question, so display an error message.
         messages.error(request, "The poll is not available.")
-        return render(request, 'polls/detail.html', {'question': question})
+        return render(request, 'polls/detail.html',
+                      {'question': question, 'choices': choices})
 
-    try:
-        selected_choice = question.choice_set.get(pk=request.POST['choice'])
-    except (KeyError, Choice.DoesNotExist):
+    selected_choice = next((choice for choice in choices
+                            if str(choice.pk) == request.POST.get('choice')),
+                           None)
+    if selected_choice is None:
         messages.error(request, "You didn't select a choice.")
-        return render(request, "polls/detail.html", {'question': question})
+        return render(request, "polls/detail.html",
+                      {'question': question, 'choices': choices})
     else:
-        # check if user already voted.
-        is_exist = Vote.objects.filter(choice__question=selected_choice.question,
-                                       user=user).exists()
-        if is_exist:
-            vote = Vote.objects.get(choice__question=selected_choice.question, user=user)
-            vote.choice = selected_choice
-            vote.save()
-            messages.success(request, f"Change vote to {vote.choice.choice_text} has been saved")
+        if ingest.is_enabled():
+            # queue the vote; it is written to the database in a batch.
+            ingest.journal().append(user.id, question.id, selected_choice.id)
+            messages.success(request, f"Your vote for {selected_choice.choice_text} has been recorded "
+                                      "and will show in the results within a few seconds")
             return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
-        else:
-            # create new vote object.
-            vote = Vote(choice=selected_choice, user=user)
-            vote.save()
+        # record the vote, or change the user's existing vote.
+        vote, created = Vote.objects.record(user, selected_choice)
+        if created:
             messages.success(request, f"Your vote for {vote.choice.choice_text} has been saved")
-            return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
+        else:
+            messages.success(request, f"Change vote to {vote.choice.choice_text} has been saved")
+        return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
 
 
 @login_required()
 def profile(request):
     """
     Showing history of User in profile page.
+
+    The votes are fetched together with their question and choice in one
+    query, a page at a time (cursor in ?after=), optionally only on open or
+    closed polls (?status=open or ?status=closed). Votes on archived polls
+    come from ArchivedVote in the archive database, merged in by id, with
+    their questions and choices read in a second query. Only votes in the
+    user's cached votes, i.e. not archived, offer to change the vote.
     """
     user = request.user
-    user_votes = Vote.objects.filter(user=user)
-    return render(request, 'polls/profile.html', {'user_votes': user_votes})
+    live_votes = (Vote.objects.filter(user=user)
+                  .select_related('question', 'choice'))
+    archived_votes = ArchivedVote.objects.filter(user=user)
+    status = request.GET.get('status')
+    if status == 'open':
+        # archived polls are closed.
+        sources = [live_votes.filter(question__in=Question.objects.open())]
+    elif status == 'closed':
+        sources = [live_votes.filter(question__in=Question.objects.closed()),
+                   archived_votes]
+    else:
+        status = ''
+        sources = [live_votes, archived_votes]
+    user_votes = {}
+    more = False
+    for votes in sources:
+        page, cursor = keyset_page(votes, ('-id',),
+                                   cursor=request.GET.get('after'),
+                                   page_size=PROFILE_PAGE_SIZE)
+        # a vote left in both by an interrupted move is shown once.
+        for user_vote in page:
+            user_votes.setdefault(user_vote.id, user_vote)
+        more = more or cursor is not None
+    user_votes = sorted(user_votes.values(), key=lambda vote: vote.id,
+                        reverse=True)
+    more = more or len(user_votes) > PROFILE_PAGE_SIZE
+    user_votes = user_votes[:PROFILE_PAGE_SIZE]
+    next_cursor = encode_cursor([user_votes[-1].id]) if more else None
+    user_votes = _with_polls(user_votes)
+    return render(request, 'polls/profile.html',
+                  {'user_votes': user_votes, 'status': status,
+                   'next_cursor': next_cursor, 'voted': voted_map(user)})
+
+
+def _with_polls(user_votes):
+    """
+    Set the question and choice of the archived votes among `user_votes`,
+    which cannot be joined across databases, from one query. Archived votes
+    whose choice was deleted are left out.
+    """
+    archived = [vote for vote in user_votes if isinstance(vote, ArchivedVote)]
+    choices = (Choice.objects.select_related('question')
+               .in_bulk({vote.choice_id for vote in archived}))
+    for vote in archived:
+        choice = choices.get(vote.choice_id)
+        if choice is not None:
+            vote.choice = choice
+            vote.question = choice.question
+    return [vote for vote in user_votes
+            if not isinstance(vote, ArchivedVote) or vote.choice_id in choices]
+
+
+@staff_member_required
+def export(request, pk, kind):
+    """
+    Stream the votes or the per-choice results of a question as CSV, or as
+    NDJSON with ?format=ndjson, without loading them all into memory.
+    """
+    question = get_object_or_404(Question, pk=pk)
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in CONTENT_TYPES:
+        file_format = 'csv'
+    response = StreamingHttpResponse(
+        export_lines(kind, file_format, [question.pk]),
+        content_type=CONTENT_TYPES[file_format])
+    filename = f'question-{question.pk}-{kind}.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _api_fields(request, name, allowed):
+    """
+    Return the fields listed in ?`name`= (all `allowed` by default), or
+    raise ValueError for an unknown one.
+    """
+    value = request.GET.get(name)
+    if not value:
+        return allowed
+    fields = tuple(value.split(','))
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError(f'unknown {name}: {", ".join(sorted(unknown))}')
+    return fields
+
+
+def _percent(votes, total):
+    return round(100 * votes / total, 1) if total else 0.0
+
+
+def results_api(request):
+    """
+    Return the results of many questions as JSON, from one query.
+
+    ?ids=1,2,3 selects questions by id and ?ids=open every open question.
+    ?fields= and ?choice_fields= pick the keys of each question
+    (text, total, choices) and choice (text, votes, percent). With
+    ?format=columns the questions and choices come as lists per key
+    instead of one object each. Responses carry an ETag, so clients
+    refreshing unchanged results get a 304.
+    """
+    ids = request.GET.get('ids', '')
+    try:
+        fields = _api_fields(request, 'fields', API_QUESTION_FIELDS)
+        choice_fields = _api_fields(request, 'choice_fields',
+                                    API_CHOICE_FIELDS)
+        if ids == 'open':
+            questions = Question.objects.open()
+        else:
+            pks = {int(pk) for pk in ids.split(',') if pk}
+            if not pks or len(pks) > API_MAX_QUESTIONS:
+                raise ValueError(f'ids must list 1 to {API_MAX_QUESTIONS} '
+                                 f'question ids, or be "open"')
+            questions = Question.objects.published().filter(pk__in=pks)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    # one row per choice, joined to its question; a question without
+    # choices gives one row of NULL choice columns.
+    rows = questions.order_by('pk', 'choice__pk').values_list(
+        'pk', 'question_text', 'vote_total', 'choice__pk',
+        'choice__choice_text', 'choice__vote_count')
+    results = []
+    for (pk, text, total), choices in itertools.groupby(
+            rows, lambda row: row[:3]):
+        question = {'id': pk, 'text': text, 'total': total, 'choices': [
+            {'id': choice_pk, 'text': choice_text, 'votes': votes,
+             'percent': _percent(votes, total)}
+            for *_, choice_pk, choice_text, votes in choices
+            if choice_pk is not None]}
+        results.append(question)
+
+    if request.GET.get('format') == 'columns':
+        question_keys = ['id'] + [key for key in fields if key != 'choices']
+        choice_keys = ['id'] + list(choice_fields)
+        payload = {'questions': {key: [question[key] for question in results]
+                                 for key in question_keys}}
+        if 'choices' in fields:
+            choices = [(question['id'], choice) for question in results
+                       for choice in question['choices']]
+            payload['choices'] = {'question_id': [pk for pk, _ in choices]}
+            payload['choices'].update({
+                key: [choice[key] for _, choice in choices]
+                for key in choice_keys})
+    else:
+        for question in results:
+            question['choices'] = [
+                {key: choice[key] for key in ('id',) + choice_fields}
+                for choice in question['choices']]
+        payload = {'questions': [
+            {key: question[key] for key in ('id',) + fields}
+            for question in results]}
+
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # results change with every vote; let clients revalidate each time.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def chart(request, pk):
+    """
+    Return the votes per choice over time of a question as JSON, read from
+    the rollups of ?granularity=minute|hour|day. ?since= and ?until= (ISO
+    8601) give the range, by default the last CHART_MAX_BUCKETS buckets
+    since the question was published.
+    """
+    question = get_object_or_404(Question.objects.published(), pk=pk)
+    granularity = request.GET.get('granularity', 'minute')
+    if granularity not in BUCKET_SIZES:
+        return JsonResponse({'error': 'granularity must be one of '
+                                      + ', '.join(BUCKET_SIZES)}, status=400)
+    size = BUCKET_SIZES[granularity]
+    try:
+        until = _parse_time(request.GET.get('until')) or timezone.now()
+        since = (_parse_time(request.GET.get('since'))
+                 or max(question.pub_date, until - size * CHART_MAX_BUCKETS))
+    except ValueError:
+        return JsonResponse({'error': 'since and until must be ISO 8601 '
+                                      'times'}, status=400)
+    if (until - since) / size > CHART_MAX_BUCKETS:
+        return JsonResponse({'error': f'the range spans more than '
+                                      f'{CHART_MAX_BUCKETS} buckets'},
+                            status=400)
+    buckets, series = rollup_chart(question.pk, granularity, since, until)
+    labels = dict(question.choice_set.values_list('pk', 'choice_text'))
+    return JsonResponse({
+        'question': question.pk,
+        'granularity': granularity,
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'choices': [{'id': choice_id, 'text': text,
+                     'votes': series.get(choice_id, [0] * len(buckets))}
+                    for choice_id, text in labels.items()],
+    })
+
+
+def _parse_time(value):
+    """
+    Return the aware datetime of an ISO 8601 string, or None if empty.
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
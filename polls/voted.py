@@ -0,0 +1,79 @@
+"""
+The polls each user has voted in.
+
+A map of question id to the id of the chosen choice is loaded with one
+query (at login, or on first use) and kept in the cache of authenticated
+users, so pages can mark voted polls and preselect earlier choices without
+reading the Vote table.
+
+A map is never changed in place, which concurrent requests could undo.
+Once a transaction saving or deleting votes of a user commits, their map is
+dropped and the next page reads it again. Maps are dropped in the cache of
+POLLS_AUTH_CACHE, so with several workers it must be a cache they share;
+with a per-process cache such as locmem, other workers serve their old
+map until VOTED_TIMEOUT.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .auth import user_cache
+from .models import Vote
+
+# Seconds a map is kept in the cache. The timeout bounds how long a map
+# can be served that missed a change, e.g. votes bulk loaded without the
+# model signals.
+VOTED_TIMEOUT = 5 * 60
+
+
+def voted_key(user_id):
+    return f'polls:voted:{user_id}'
+
+
+def load_voted(user_id):
+    """
+    Read the votes of a user from the database into the cache.
+    """
+    voted = dict(Vote.objects.filter(user_id=user_id)
+                 .values_list('question_id', 'choice_id'))
+    user_cache().set(voted_key(user_id), voted, VOTED_TIMEOUT)
+    return voted
+
+
+def voted_map(user):
+    """
+    Return {question id: choice id} of the votes of `user`, empty for an
+    anonymous user.
+    """
+    if not user.is_authenticated:
+        return {}
+    voted = user_cache().get(voted_key(user.pk))
+    if voted is None:
+        voted = load_voted(user.pk)
+    return voted
+
+
+avoted_map = sync_to_async(voted_map)
+
+
+def forget_voted(user_id):
+    """
+    Remove the map of a user from the cache, so it is read again.
+    """
+    user_cache().delete(voted_key(user_id))
+
+
+def forget_voted_many(user_ids):
+    """
+    Remove the maps of many users, e.g. after moving their votes in bulk.
+    """
+    user_cache().delete_many([voted_key(user_id) for user_id in user_ids])
+
+
+def forget_voted_on_commit(user_ids, using=None):
+    """
+    Remove the maps of users once the current transaction on `using`
+    commits, so a rolled back change is never cached and a map read before
+    the commit is not kept.
+    """
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: forget_voted_many(user_ids), using=using)